@@ -4,13 +4,14 @@ from typing import List
 from fastapi import Depends, HTTPException, FastAPI
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 from starlette import status
 from common.models import User, Interest, Subscription
 from common.schemas import UsersResponse, UserResponseAdmin, InterestResponse, SubscriptionCreate, SubscriptionSchema
 from common.utils import get_admin_by_username, create_access_token
 from common.utils.auth_utils import verify_password
-from config import SessionLocal
+from config import AsyncSessionLocal
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -30,8 +31,8 @@ app.add_middleware(
 
 @app.post("/admin/login", summary="Авторизация администратора")
 async def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
-    with SessionLocal() as db:
-        admin = get_admin_by_username(db, username=form_data.username)
+    async with AsyncSessionLocal() as db:
+        admin = await get_admin_by_username(db, username=form_data.username)
 
         if not admin or not verify_password(form_data.password, admin.hashed_password):
             raise HTTPException(
@@ -64,8 +65,9 @@ async def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
 
 @app.get("/admin/users", response_model=UsersResponse, summary="Получение списка всех пользователей")
 async def get_all_users():
-    with SessionLocal() as db:
-        db_users = db.query(User).options(joinedload(User.city)).all()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).options(joinedload(User.city)))
+        db_users = result.scalars().all()
         if not db_users:
             raise HTTPException(status_code=404, detail="Users not found")
 
@@ -88,8 +90,9 @@ async def get_all_users():
 
 @app.get("/admin/user/{user_id}", response_model=UserResponseAdmin, summary="Получение информации о конкретном пользователе")
 async def get_user_info(user_id: int):
-    with SessionLocal() as db:
-        db_user = db.query(User).options(joinedload(User.city)).filter(User.id == user_id).first()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).options(joinedload(User.city)).where(User.id == user_id))
+        db_user = result.scalars().first()
         if db_user is None:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -98,8 +101,9 @@ async def get_user_info(user_id: int):
 
 @app.get("/admin/interests_list", summary="Получение списка доступных интересов", response_model=InterestResponse)
 async def get_interests_list():
-    with SessionLocal() as db:
-        interests = db.query(Interest).all()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Interest))
+        interests = result.scalars().all()
         if not interests:
             raise HTTPException(status_code=404, detail="No interests found")
 
@@ -109,32 +113,33 @@ async def get_interests_list():
 
 
 @app.get("/admin/subscriptions", response_model=List[SubscriptionSchema])
-def read_subscriptions(skip: int = 0, limit: int = 100):
-    with SessionLocal() as db:
-        subscriptions = db.query(Subscription).offset(skip).limit(limit).all()
+async def read_subscriptions(skip: int = 0, limit: int = 100):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Subscription).offset(skip).limit(limit))
+        subscriptions = result.scalars().all()
 
     return subscriptions
 
 
 @app.post("/admin/create_subscription", response_model=SubscriptionSchema)
-def create_subscription(subscription: SubscriptionCreate):
-    with SessionLocal() as db:
+async def create_subscription(subscription: SubscriptionCreate):
+    async with AsyncSessionLocal() as db:
         db_subscription = Subscription(**subscription.dict())
         db.add(db_subscription)
-        db.commit()
-        db.refresh(db_subscription)
+        await db.commit()
+        await db.refresh(db_subscription)
 
     return db_subscription
 
 
 @app.delete("/admin/delete_subscription/{subscription_id}", response_model=SubscriptionSchema)
-def delete_subscription(subscription_id: int):
-    with SessionLocal() as db:
-        db_subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+async def delete_subscription(subscription_id: int):
+    async with AsyncSessionLocal() as db:
+        db_subscription = await db.get(Subscription, subscription_id)
         if db_subscription is None:
             raise HTTPException(status_code=404, detail="Subscription not found")
-        db.delete(db_subscription)
-        db.commit()
+        await db.delete(db_subscription)
+        await db.commit()
 
     return db_subscription
 
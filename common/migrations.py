@@ -0,0 +1,80 @@
+"""
+Схема базы: отсутствующие таблицы и изменения существующих.
+
+Base.metadata.create_all создаёт только отсутствующие таблицы и не трогает существующие:
+новые колонки и индексы на старых таблицах добавляются здесь явным DDL.
+Каждая миграция выполняется один раз и записывается в schema_migrations; шаги написаны
+идемпотентно (IF NOT EXISTS), поэтому на свежей базе после create_all они ничего не меняют.
+
+run_migrations выполняет create_all и миграции в одной транзакции под advisory-блокировкой,
+поэтому его безопасно вызывать при старте каждого приложения (main_app, socket_app) в любом
+порядке. Новые таблицы (chat_summaries, socket_connections) на существующей базе создаёт
+create_all; они же записаны миграциями, чтобы история схемы была полной. Сводки старых чатов
+заполняются лениво: refresh_chat_summaries при выдаче списка чатов и при первом новом сообщении.
+
+Запускается при старте main_app и socket_app и вручную: python -m common.migrations
+"""
+from sqlalchemy import text
+
+from common.models import ChatSummary, SocketConnection
+from common.utils.geo_utils import GEO_CELL_SIZE
+from config import engine, logger, Base
+
+# Ключ pg_advisory_xact_lock: несколько процессов не применяют миграции одновременно
+MIGRATIONS_LOCK_KEY = 7310001
+
+
+def _backfill_geo_cells(conn):
+    # Та же формула, что в geo_utils.geo_cell: "floor(lat / size):floor(lon / size)"
+    conn.execute(text(
+        """
+        UPDATE user_geolocation
+        SET geo_cell = floor(latitude / :cell_size)::bigint::text || ':' || floor(longitude / :cell_size)::bigint::text
+        WHERE geo_cell IS NULL
+        """
+    ), {"cell_size": GEO_CELL_SIZE})
+
+
+MIGRATIONS = [
+    ("0001_user_geolocation_geo_cell", [
+        "ALTER TABLE user_geolocation ADD COLUMN IF NOT EXISTS geo_cell VARCHAR",
+        _backfill_geo_cells,
+        "CREATE INDEX IF NOT EXISTS ix_user_geolocation_geo_cell ON user_geolocation (geo_cell)",
+    ]),
+    ("0002_chat_summaries", [
+        lambda conn: ChatSummary.__table__.create(bind=conn, checkfirst=True),
+    ]),
+    ("0003_push_tokens_token_index", [
+        "CREATE INDEX IF NOT EXISTS ix_push_tokens_token ON push_tokens (token)",
+    ]),
+    ("0004_socket_connections", [
+        lambda conn: SocketConnection.__table__.create(bind=conn, checkfirst=True),
+    ]),
+]
+
+
+def run_migrations(bind=engine):
+    with bind.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+        # Отсутствующие таблицы — под той же блокировкой: приложения стартуют в любом порядке
+        Base.metadata.create_all(bind=conn)
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+        applied = set(conn.execute(text("SELECT name FROM schema_migrations")).scalars())
+
+        for name, steps in MIGRATIONS:
+            if name in applied:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+            logger.info(f"Migration {name} applied")
+
+
+if __name__ == "__main__":
+    run_migrations()
@@ -8,7 +8,7 @@ from .auth_models import TemporaryCode, RefreshToken
 from .cities_models import Region, City
 
 # Communication models
-from .communication_models import MessageTypeEnum, Chat, Message, Media, DateInvitations, VoiceMessage
+from .communication_models import MessageTypeEnum, Chat, Message, Media, DateInvitations, VoiceMessage, ChatSummary, SocketConnection
 
 # Error models
 from .error_models import ErrorResponse
@@ -79,4 +79,30 @@ class DateInvitations(Base):
     recipient_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
     status = Column(Enum('pending', 'accepted', 'declined'), default='pending')
-    timestamp = Column(DateTime, default=datetime.now)
\ No newline at end of file
+    timestamp = Column(DateTime, default=datetime.now)
+
+class ChatSummary(Base):
+    # Сводка чата для списка чатов, своя для каждого участника: последнее видимое ему сообщение
+    # и число непрочитанных им сообщений. Обновляется в той же транзакции, что и сообщения.
+    __tablename__ = 'chat_summaries'
+
+    chat_id = Column(Integer, ForeignKey('chats.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    last_message_id = Column(Integer, ForeignKey('messages.id'), nullable=True)
+    last_message_type = Column(Enum(MessageTypeEnum), nullable=True)
+    last_message_preview = Column(String, nullable=True)
+    last_message_status = Column(String, nullable=True)
+    last_message_sender_id = Column(Integer, nullable=True)
+    unread_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SocketConnection(Base):
+    # Узлы socket_app, к которым подключён пользователь: строка на пару (пользователь, узел).
+    # Подключения внутри узла считает его ConnectionRegistry; пользователь онлайн, пока есть хотя бы одна строка.
+    # При рестарте узел удаляет свои строки.
+    __tablename__ = 'socket_connections'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    node_id = Column(String, primary_key=True, index=True)
+    connected_at = Column(DateTime, default=datetime.utcnow)
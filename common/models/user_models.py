@@ -44,7 +44,7 @@ class PushTokens(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    token = Column(String, nullable=False)
+    token = Column(String, nullable=False, index=True)
     active = Column(Boolean, default=True, nullable=False)
 
     user = relationship("User", back_populates="tokens")
@@ -75,6 +75,7 @@ class UserGeolocation(Base):
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    geo_cell = Column(String, index=True)
     created_at = Column(DateTime, default=datetime.now, nullable=False)
     updated_at = Column(DateTime, default=datetime.now, nullable=False)
 
@@ -12,7 +12,10 @@ from .communication_schemas import (
     ChatPersonResponse,
     ChatDetailsResponse,
     DateInvitationResponse,
-    PushMessage
+    PushMessage,
+    PushBatchRequest,
+    PushResult,
+    PushBatchResponse
 )
 from .interests_schemas import (
     AddInterestsResponse,
@@ -23,7 +26,7 @@ from .interests_schemas import (
     InterestItem,
     UserInterestResponse
 )
-from .likes_schemas import Favorite, FavoriteCreate, MatchResponse
+from .likes_schemas import Favorite, FavoriteCreate, MatchResponse, MatchesPageResponse
 from .service_schemas import CityQuery, VerificationStatus, VerificationUpdate
 from .user_schemas import (
     UserCreate,
@@ -85,3 +85,22 @@ class PushMessage(BaseModel):
     title: str
     body: str
     data: Dict[str, Any]
+
+
+class PushBatchRequest(BaseModel):
+    messages: List[PushMessage]
+
+
+class PushResult(BaseModel):
+    token: str
+    success: bool
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+    token_invalid: bool = False
+
+
+class PushBatchResponse(BaseModel):
+    success_count: int
+    failure_count: int
+    results: List[PushResult]
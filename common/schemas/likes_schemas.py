@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, List
 from datetime import date
 from pydantic import BaseModel
 
@@ -22,6 +22,12 @@ class MatchResponse(BaseModel):
     gender: str
     status: Optional[str] = None
     city_name: Optional[str] = None
+    interests: Optional[List[str]] = None
     avatar_url: Optional[str] = None
     match_percentage: Optional[float] = None
     is_favorite: Optional[bool] = None
+
+
+class MatchesPageResponse(BaseModel):
+    matches: List[MatchResponse]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,23 @@
+import socketio
+
+# Модуль не импортирует config — его использует сам config при создании sio.
+
+
+def create_client_manager(url, channel='socketio'):
+    """
+    Менеджер по URL шины: пусто — один процесс без шины, local:// — шина в памяти,
+    redis:// / rediss:// — Redis-совместимый сервер, postgresql:// — LISTEN/NOTIFY.
+    """
+    if not url:
+        return socketio.AsyncManager()
+    # Реализации шин (и их драйверы) подгружаются только для выбранной схемы URL
+    if url.startswith('local://'):
+        from common.socketio_pubsub import LocalPubSubManager
+        return LocalPubSubManager(url, channel=channel)
+    if url.startswith(('redis://', 'rediss://')):
+        from common.socketio_pubsub import RedisManager
+        return RedisManager(url, channel=channel)
+    if url.startswith(('postgres://', 'postgresql://', 'postgresql+asyncpg://')):
+        from common.socketio_pubsub import PostgresNotifyManager
+        return PostgresNotifyManager(url, channel=channel)
+    raise ValueError(f"Unsupported Socket.IO message queue URL: {url}")
@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+from socketio import AsyncRedisManager
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+# Менеджеры клиентов Socket.IO для запуска socket_app на нескольких процессах/узлах:
+# эмит в комнату публикуется в общую шину, и каждый узел доставляет его своим подключениям.
+# Импортируется только из create_client_manager, когда шина действительно настроена.
+
+
+class _DirectSidEmitMixin:
+    # Ответ конкретному подключению этого узла не нужно гонять через шину
+    async def emit(self, event, data, namespace=None, room=None, **kwargs):
+        if room is not None and not kwargs.get('ignore_queue') and self.is_connected(room, namespace or '/'):
+            kwargs['ignore_queue'] = True
+        return await super().emit(event, data, namespace=namespace, room=room, **kwargs)
+
+
+class LocalPubSubManager(_DirectSidEmitMixin, AsyncPubSubManager):
+    """
+    Шина в памяти процесса: все серверы с одним каналом ведут себя как узлы одного кластера.
+    Для тестов и локального запуска нескольких AsyncServer в одном процессе.
+    """
+    name = 'local'
+
+    _subscribers = {}  # channel -> [asyncio.Queue]
+
+    def __init__(self, url='local://', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    async def _publish(self, data):
+        # Сериализация как у настоящей шины, чтобы ловить несериализуемые payload'ы
+        message = json.dumps(data)
+        for queue in list(self._subscribers.get(self.channel, ())):
+            queue.put_nowait(message)
+
+    async def _listen(self):
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(self.channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[self.channel].remove(queue)
+
+
+# NOTIFY принимает payload меньше 8000 байт
+NOTIFY_PAYLOAD_LIMIT = 7900
+# Большой payload кладётся в таблицу, по шине уходит "ref:<id>"
+PAYLOAD_REF_PREFIX = "ref:"
+# Сколько секунд хранится отложенный payload: за это время его успевают прочитать все узлы
+PAYLOAD_RETENTION = 60
+
+
+class PostgresNotifyManager(_DirectSidEmitMixin, AsyncPubSubManager):
+    """
+    Шина поверх LISTEN/NOTIFY PostgreSQL (asyncpg).
+    Payload NOTIFY ограничен 8000 байт: сообщения больше NOTIFY_PAYLOAD_LIMIT (длинный текст,
+    большие пачки статусов) сохраняются в UNLOGGED-таблицу socketio_payloads, а по шине уходит
+    только их id. Узлы читают payload по id; записи старше PAYLOAD_RETENTION удаляются.
+    Ответы отдельному локальному sid уходят мимо шины.
+    """
+    name = 'postgres'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url.replace('+asyncpg', '', 1)
+        self._pool = None
+        self._payload_table_ready = False
+
+    async def _publish(self, data):
+        if self._pool is None:
+            import asyncpg
+            self._pool = await asyncpg.create_pool(self.url, min_size=1, max_size=4)
+        message = json.dumps(data)
+        if len(message.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            message = f"{PAYLOAD_REF_PREFIX}{await self._store_payload(message)}"
+        await self._pool.execute("SELECT pg_notify($1, $2)", self.channel, message)
+
+    async def _store_payload(self, message: str) -> int:
+        import asyncpg
+
+        async with self._pool.acquire() as connection:
+            if not self._payload_table_ready:
+                try:
+                    await connection.execute(
+                        "CREATE UNLOGGED TABLE IF NOT EXISTS socketio_payloads ("
+                        "id BIGSERIAL PRIMARY KEY, payload TEXT NOT NULL, "
+                        "created_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+                    )
+                except asyncpg.exceptions.UniqueViolationError:
+                    # Таблицу одновременно создал другой узел
+                    pass
+                self._payload_table_ready = True
+            await connection.execute(
+                "DELETE FROM socketio_payloads WHERE created_at < now() - make_interval(secs => $1)",
+                PAYLOAD_RETENTION
+            )
+            return await connection.fetchval(
+                "INSERT INTO socketio_payloads (payload) VALUES ($1) RETURNING id", message
+            )
+
+    async def _listen(self):
+        import asyncpg
+
+        queue = asyncio.Queue()
+        connection = await asyncpg.connect(self.url)
+        # None в очереди — соединение оборвалось, базовый класс переподключится
+        connection.add_termination_listener(lambda conn: queue.put_nowait(None))
+        await connection.add_listener(
+            self.channel, lambda conn, pid, channel, payload: queue.put_nowait(payload)
+        )
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    raise ConnectionError("LISTEN connection to PostgreSQL was closed")
+                if message.startswith(PAYLOAD_REF_PREFIX):
+                    payload_id = int(message[len(PAYLOAD_REF_PREFIX):])
+                    message = await connection.fetchval(
+                        "SELECT payload FROM socketio_payloads WHERE id = $1", payload_id
+                    )
+                    if message is None:
+                        self._get_logger().warning(f"Socket.IO payload {payload_id} expired before delivery")
+                        continue
+                yield message
+        finally:
+            if not connection.is_closed():
+                await connection.close()
+
+
+class RedisManager(_DirectSidEmitMixin, AsyncRedisManager):
+    name = 'redis'
+
@@ -10,10 +10,49 @@ from .auth_utils import (
     send_photos_to_bot,
     generate_verification_code
 )
+from .chat_utils import (
+    refresh_chat_summaries,
+    record_new_message,
+    record_messages_status,
+    record_messages_read
+)
 from .crud import (
     delete_user_and_related_data,
-    get_admin_by_username
+    get_admin_by_username,
+    get_avatar_urls,
+    get_city_names,
+    get_interest_texts,
+    get_users_details
+)
+from .geo_utils import geo_cell, geo_filter_params, geo_filter_sql
+from .match_utils import (
+    execute_sql,
+    candidate_index,
+    calculate_match_percentage,
+    get_match_percentages,
+    MATCH_PERCENTAGE_SQL,
+    match_cursor_params,
+    encode_match_cursor,
+    decode_match_cursor
+)
+from .push_utils import push_dispatcher, notify_user
+from .service_utils import (
+    send_push_notification,
+    PushRetryableError,
+    send_push_notifications_batch,
+    send_event_to_socketio,
+    security,
+    start_push_http_client,
+    close_push_http_client
+)
+from .storage_utils import (
+    storage,
+    StorageObjectNotFound,
+    StorageNotModified,
+    StorageRangeNotSatisfiable,
+    bucket_for_key,
+    parse_byte_range,
+    public_media_url,
+    public_media_urls
 )
-from .match_utils import execute_sql
-from .service_utils import send_push_notification, send_event_to_socketio, security
-from .user_utils import get_user_push_token, get_user_name, get_current_user
\ No newline at end of file
+from .user_utils import get_user_push_token, get_user_name, get_current_user, deactivate_push_tokens
\ No newline at end of file
@@ -1,5 +1,4 @@
 import json
-import os
 import random
 import requests
 from fastapi import HTTPException, Header
@@ -95,22 +94,22 @@ def send_text_message(user_id, first_name):
         print("Error sending text message:", response.status_code)
         print(response.text)
 
-def send_photos_to_bot(user_id, first_name, photo_paths):
+def send_photos_to_bot(user_id, first_name, photos):
+    """
+    photos — список пар (имя файла, файловый объект); файлы отправляются из памяти, без записи на диск.
+    """
     send_text_message(user_id, first_name)
     media = [
         {
             "type": "photo",
-            "media": f"attach://{os.path.basename(photo_path)}"
+            "media": f"attach://{file_name}"
         }
-        for photo_path in photo_paths
+        for file_name, _ in photos
     ]
-    files = [(os.path.basename(photo_path), (os.path.basename(photo_path), open(photo_path, "rb"))) for photo_path in photo_paths]
-
-    for photo_path in photo_paths:
-        if os.path.exists(photo_path):
-            files.append((os.path.basename(photo_path), (os.path.basename(photo_path), open(photo_path, "rb"))))
-        else:
-            print(f"File {photo_path} does not exist.")
+    files = []
+    for file_name, file_obj in photos:
+        file_obj.seek(0)
+        files.append((file_name, (file_name, file_obj)))
 
     data = {
         "chat_id": f"{VERIFY_CHAT_ID}",
@@ -119,10 +118,6 @@ def send_photos_to_bot(user_id, first_name, photo_paths):
 
     response = requests.post(VERIFY_CHAT_LINK, data=data, files=files)
 
-    for photo_path in photo_paths:
-        if os.path.exists(photo_path):
-            os.remove(photo_path)
-
     if response.status_code != 200:
         print("Error:", response.status_code)
         print(response.text)
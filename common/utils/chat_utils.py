@@ -0,0 +1,146 @@
+from datetime import datetime
+
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from common.models import Chat, Message, ChatSummary
+
+PREVIEW_LENGTH = 200
+
+_SUMMARY_COLUMNS = (
+    "last_message_id",
+    "last_message_type",
+    "last_message_preview",
+    "last_message_status",
+    "last_message_sender_id",
+    "unread_count",
+    "updated_at",
+)
+
+
+def message_preview(content):
+    return content[:PREVIEW_LENGTH] if content else content
+
+
+def visible_to(user_id: int):
+    # Сообщение видно пользователю, если не удалено с его стороны чата
+    return or_(
+        (Chat.user1_id == user_id) & Message.deleted_for_user1.is_(False),
+        (Chat.user2_id == user_id) & Message.deleted_for_user2.is_(False)
+    )
+
+
+def refresh_chat_summaries(db: Session, user_id: int, chat_ids):
+    """
+    Пересчитывает сводки пользователя по чатам chat_ids из таблицы сообщений.
+    Нужен для чатов без сводки и после удаления сообщений; на запись сообщения не вызывается.
+    """
+    chat_ids = list(chat_ids)
+    if not chat_ids:
+        return
+
+    # Время берём до чтения сообщений: сводку, записанную после этого момента, пересчёт не затирает
+    now = datetime.utcnow()
+    ranked_messages = db.query(
+        Message.chat_id,
+        Message.id,
+        Message.message_type,
+        Message.content,
+        Message.status,
+        Message.sender_id,
+        func.row_number().over(
+            partition_by=Message.chat_id,
+            order_by=(Message.created_at.desc(), Message.id.desc())
+        ).label("position")
+    ).join(Chat, Chat.id == Message.chat_id).filter(
+        Message.chat_id.in_(chat_ids), visible_to(user_id)
+    ).subquery()
+    last_messages = {
+        row.chat_id: row
+        for row in db.query(ranked_messages).filter(ranked_messages.c.position == 1).all()
+    }
+
+    unread_counts = dict(db.query(Message.chat_id, func.count(Message.id)).join(
+        Chat, Chat.id == Message.chat_id
+    ).filter(
+        Message.chat_id.in_(chat_ids),
+        Message.status != 'read',
+        Message.sender_id != user_id,
+        visible_to(user_id)
+    ).group_by(Message.chat_id).all())
+
+    rows = []
+    for chat_id in chat_ids:
+        last_message = last_messages.get(chat_id)
+        rows.append({
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "last_message_id": last_message.id if last_message else None,
+            "last_message_type": last_message.message_type if last_message else None,
+            "last_message_preview": message_preview(last_message.content) if last_message else None,
+            "last_message_status": last_message.status if last_message else None,
+            "last_message_sender_id": last_message.sender_id if last_message else None,
+            "unread_count": unread_counts.get(chat_id, 0),
+            "updated_at": now,
+        })
+
+    stmt = insert(ChatSummary).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[ChatSummary.chat_id, ChatSummary.user_id],
+        set_={column: getattr(stmt.excluded, column) for column in _SUMMARY_COLUMNS},
+        where=ChatSummary.updated_at <= stmt.excluded.updated_at
+    ))
+
+
+def record_new_message(db: Session, chat: Chat, message: Message):
+    """
+    Новое сообщение становится последним у обоих участников, у получателя растёт счётчик непрочитанных.
+    Сообщение должно быть уже записано (flush).
+    """
+    participants = {user_id for user_id in (chat.user1_id, chat.user2_id) if user_id is not None}
+    updated = db.execute(
+        update(ChatSummary).where(
+            ChatSummary.chat_id == chat.id, ChatSummary.user_id.in_(participants)
+        ).values(
+            last_message_id=message.id,
+            last_message_type=message.message_type,
+            last_message_preview=message_preview(message.content),
+            last_message_status=message.status,
+            last_message_sender_id=message.sender_id,
+            unread_count=ChatSummary.unread_count + case((ChatSummary.user_id != message.sender_id, 1), else_=0),
+            updated_at=datetime.utcnow()
+        ).returning(ChatSummary.user_id).execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    # Сводки ещё нет (чат старше таблицы сводок) — считаем её по сообщениям целиком
+    for user_id in participants - set(updated):
+        refresh_chat_summaries(db, user_id, [chat.id])
+
+
+def record_messages_status(db: Session, message_ids, status: str):
+    # Статус меняем только там, где сообщение — последнее в сводке
+    db.execute(
+        update(ChatSummary).where(ChatSummary.last_message_id.in_(list(message_ids)))
+        .values(last_message_status=status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def record_messages_read(db: Session, chat_id: int, reader_id: int, read_count: int = None):
+    """
+    Читатель прочитал read_count сообщений чата; None — прочитал всё.
+    """
+    unread_count = 0 if read_count is None else func.greatest(ChatSummary.unread_count - read_count, 0)
+    db.execute(
+        update(ChatSummary).where(ChatSummary.chat_id == chat_id, ChatSummary.user_id == reader_id)
+        .values(unread_count=unread_count, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if read_count is None:
+        # Все сообщения собеседника прочитаны — значит, и последнее из них
+        db.execute(
+            update(ChatSummary).where(
+                ChatSummary.chat_id == chat_id, ChatSummary.last_message_sender_id != reader_id
+            ).values(last_message_status='read').execution_options(synchronize_session=False)
+        )
@@ -1,5 +1,10 @@
+from collections import defaultdict
+
+from sqlalchemy import or_, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from common.models import Admin, Chat, User
+from common.models import Admin, Chat, User, UserPhoto, City, Interest, UserInterest, Like, Favorite
+from common.utils.storage_utils import public_media_urls
 
 
 def delete_user_and_related_data(db: Session, user_id: int) -> bool:
@@ -16,5 +21,74 @@ def delete_user_and_related_data(db: Session, user_id: int) -> bool:
     return False
 
 
-def get_admin_by_username(db: Session, username: str):
-    return db.query(Admin).filter(Admin.username == username).first()
\ No newline at end of file
+async def get_admin_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(Admin).where(Admin.username == username))
+    return result.scalars().first()
+
+
+def get_avatar_urls(db: Session, user_ids) -> dict:
+    # Аватары пачкой: {user_id: photo_url}, ссылки сразу в виде для клиента
+    if not user_ids:
+        return {}
+    rows = db.query(UserPhoto.user_id, UserPhoto.photo_url).filter(
+        UserPhoto.user_id.in_(user_ids), UserPhoto.is_avatar.is_(True)
+    ).all()
+    urls = public_media_urls(photo_url for user_id, photo_url in rows)
+    return {user_id: urls[photo_url] for user_id, photo_url in rows}
+
+
+def get_city_names(db: Session, city_ids) -> dict:
+    # Названия городов пачкой: {city_id: city_name}
+    city_ids = {city_id for city_id in city_ids if city_id}
+    if not city_ids:
+        return {}
+    rows = db.query(City.id, City.city_name).filter(City.id.in_(city_ids)).all()
+    return {city_id: city_name for city_id, city_name in rows}
+
+
+def get_interest_texts(db: Session, user_ids) -> dict:
+    # Интересы пачкой: {user_id: [interest_text, ...]}
+    interests = defaultdict(list)
+    if not user_ids:
+        return interests
+    rows = db.query(UserInterest.user_id, Interest.interest_text).join(
+        Interest, Interest.id == UserInterest.interest_id
+    ).filter(UserInterest.user_id.in_(user_ids)).all()
+    for user_id, interest_text in rows:
+        interests[user_id].append(interest_text)
+    return interests
+
+
+def get_users_details(db: Session, current_user_id: int, users) -> dict:
+    """
+    Данные для списков пользователей одним набором запросов:
+    {user_id: {"avatar_url", "city_name", "likes_me", "liked_by_me", "is_favorite"}}.
+    """
+    user_ids = [user.id for user in users]
+    if not user_ids:
+        return {}
+
+    avatar_urls = get_avatar_urls(db, user_ids)
+    city_names = get_city_names(db, [user.city_id for user in users])
+
+    likes = db.query(Like.user_id, Like.liked_user_id).filter(or_(
+        and_(Like.user_id == current_user_id, Like.liked_user_id.in_(user_ids)),
+        and_(Like.liked_user_id == current_user_id, Like.user_id.in_(user_ids))
+    )).all()
+    liked_by_me = {liked_user_id for user_id, liked_user_id in likes if user_id == current_user_id}
+    likes_me = {user_id for user_id, liked_user_id in likes if liked_user_id == current_user_id}
+
+    favorite_ids = {row[0] for row in db.query(Favorite.favorite_user_id).filter(
+        Favorite.user_id == current_user_id, Favorite.favorite_user_id.in_(user_ids)
+    ).all()}
+
+    return {
+        user.id: {
+            "avatar_url": avatar_urls.get(user.id),
+            "city_name": city_names.get(user.city_id),
+            "likes_me": user.id in likes_me,
+            "liked_by_me": user.id in liked_by_me,
+            "is_favorite": user.id in favorite_ids,
+        }
+        for user in users
+    }
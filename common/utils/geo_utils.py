@@ -0,0 +1,108 @@
+import math
+
+from config import MAX_DISTANCE
+
+KM_PER_DEGREE = 111.2
+
+# Сторона ячейки сетки по широте примерно равна MAX_DISTANCE,
+# поэтому рамка поиска вокруг точки покрывает всего несколько соседних ячеек
+GEO_CELL_SIZE = MAX_DISTANCE / KM_PER_DEGREE
+
+# Предел длины списка ячеек в запросе: у полюсов рамка покрывает сотни ячеек
+GEO_MAX_CELLS = 64
+
+
+def geo_cell(latitude: float, longitude: float) -> str:
+    """
+    Возвращает идентификатор ячейки сетки для координат.
+    """
+    return f"{math.floor(latitude / GEO_CELL_SIZE)}:{math.floor(longitude / GEO_CELL_SIZE)}"
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float = MAX_DISTANCE) -> tuple:
+    """
+    Рамка (min_lat, max_lat, min_lon, max_lon), гарантированно содержащая круг радиусом radius_km.
+    Широта обрезана по полюсам; долгота не приводится к [-180, 180] — см. longitude_ranges.
+    Если рамка касается полюса, по долготе она занимает весь круг.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(latitude - lat_delta, -90), min(latitude + lat_delta, 90)
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    lon_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+    if min_lat <= -90 or max_lat >= 90 or lon_delta >= 180:
+        return min_lat, max_lat, -180, 180
+    return min_lat, max_lat, longitude - lon_delta, longitude + lon_delta
+
+
+def longitude_ranges(min_lon: float, max_lon: float) -> list:
+    """
+    Диапазоны долготы в пределах [-180, 180]: рамка через антимеридиан делится на два.
+    """
+    if max_lon - min_lon >= 360:
+        return [(-180, 180)]
+    if min_lon < -180:
+        return [(min_lon + 360, 180), (-180, max_lon)]
+    if max_lon > 180:
+        return [(min_lon, 180), (-180, max_lon - 360)]
+    return [(min_lon, max_lon)]
+
+
+def cells_in_box(box: tuple):
+    """
+    Ячейки сетки, покрывающие рамку; None — ячеек больше GEO_MAX_CELLS (рамка у полюса),
+    тогда фильтр по ячейкам не применяется и остаётся только рамка.
+    """
+    min_lat, max_lat, min_lon, max_lon = box
+    rows = range(math.floor(min_lat / GEO_CELL_SIZE), math.floor(max_lat / GEO_CELL_SIZE) + 1)
+    cols = []
+    for range_min, range_max in longitude_ranges(min_lon, max_lon):
+        cols.extend(range(math.floor(range_min / GEO_CELL_SIZE), math.floor(range_max / GEO_CELL_SIZE) + 1))
+    if len(rows) * len(cols) > GEO_MAX_CELLS:
+        return None
+    return [f"{row}:{col}" for row in rows for col in dict.fromkeys(cols)]
+
+
+def geo_filter_sql(alias: str) -> str:
+    """
+    Условия префильтра по расстоянию для строки user_geolocation с псевдонимом alias;
+    параметры — из geo_filter_params.
+    """
+    return f"""
+        AND (NOT :use_geo_cells OR {alias}.geo_cell = ANY(:geo_cells))
+        AND {alias}.latitude BETWEEN :min_lat AND :max_lat
+        AND ({alias}.longitude BETWEEN :min_lon AND :max_lon OR {alias}.longitude BETWEEN :min_lon_2 AND :max_lon_2)
+    """
+
+
+def geo_filter_params(geolocation) -> dict:
+    """
+    Параметры префильтра по расстоянию для SQL-запросов подбора (geo_filter_sql).
+    Без геопозиции текущего пользователя фильтр ничего не пропускает.
+    Рамка через антимеридиан задаётся двумя диапазонами долготы, иначе второй повторяет первый.
+    """
+    if geolocation is None:
+        return {
+            "use_geo_cells": True,
+            "geo_cells": [],
+            "min_lat": None,
+            "max_lat": None,
+            "min_lon": None,
+            "max_lon": None,
+            "min_lon_2": None,
+            "max_lon_2": None,
+        }
+
+    box = bounding_box(geolocation.latitude, geolocation.longitude)
+    cells = cells_in_box(box)
+    lon_ranges = longitude_ranges(box[2], box[3])
+    (min_lon, max_lon), (min_lon_2, max_lon_2) = lon_ranges[0], lon_ranges[-1]
+    return {
+        "use_geo_cells": cells is not None,
+        "geo_cells": cells or [],
+        "min_lat": box[0],
+        "max_lat": box[1],
+        "min_lon": min_lon,
+        "max_lon": max_lon,
+        "min_lon_2": min_lon_2,
+        "max_lon_2": max_lon_2,
+    }
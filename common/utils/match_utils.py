@@ -1,5 +1,21 @@
-from config import SessionLocal
-from sqlalchemy import text
+import base64
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text, event
+from sqlalchemy.orm import Session
+
+from common.models import User, UserGeolocation
+from common.utils.geo_utils import geo_filter_params, geo_filter_sql
+from config import (
+    SessionLocal,
+    MAX_DISTANCE,
+    MATCH_SCORE_CACHE_TTL,
+    CANDIDATE_INDEX_TTL,
+    CANDIDATE_INDEX_MAX_BUCKETS
+)
 
 
 def execute_sql(query: str, params: dict) -> list:
@@ -11,3 +27,313 @@ def execute_sql(query: str, params: dict) -> list:
         # Преобразование результатов в список словарей
         keys = result.keys()
         return [dict(zip(keys, row)) for row in result.fetchall()]
+
+
+def calculate_match_percentage(common_interests_count: int, interests_count: int, distance) -> float:
+    """
+    Процент совпадения: среднее между долей общих интересов и попаданием в MAX_DISTANCE.
+    """
+    interests_percentage = (common_interests_count / interests_count) * 100 if interests_count else 0
+    distance_percentage = 100 if distance is not None and distance <= MAX_DISTANCE else 0
+    return (interests_percentage + distance_percentage) / 2
+
+
+# Тот же расчёт в SQL (те же операции над float8, результат совпадает до бита):
+# лента сортирует и режет страницу в БД. Параметры :interests_count и :max_distance
+MATCH_PERCENTAGE_SQL = """
+    ((CASE WHEN :interests_count > 0 THEN common_interests_count::float8 / :interests_count * 100 ELSE 0 END)
+     + (CASE WHEN distance <= :max_distance THEN 100 ELSE 0 END)) / 2
+"""
+
+
+class MatchScoreCache:
+    """
+    Короткоживущий кэш процентов совпадения: {текущий пользователь: {другой пользователь: процент}}.
+    Общий для вкладок «избранное», «лайкнули меня» и «мои лайки».
+    """
+
+    def __init__(self, ttl: int):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # user_id -> (expires_at, {other_user_id: match_percentage})
+        self._next_purge = time.monotonic() + ttl
+
+    def get_many(self, user_id: int, user_ids) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                return {}
+            return {other_id: entry[1][other_id] for other_id in user_ids if other_id in entry[1]}
+
+    def set_many(self, user_id: int, scores: dict):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_purge:
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+                self._next_purge = now + self._ttl
+
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                entry = (now + self._ttl, {})
+                self._entries[user_id] = entry
+            entry[1].update(scores)
+
+
+match_score_cache = MatchScoreCache(MATCH_SCORE_CACHE_TTL)
+
+
+def get_match_percentages(current_user: User, user_ids) -> dict:
+    """
+    Процент совпадения текущего пользователя с каждым из user_ids: {user_id: match_percentage}.
+    Расстояние и общие интересы считаются одним запросом только для переданных пользователей.
+    """
+    user_ids = set(user_ids)
+    scores = match_score_cache.get_many(current_user.id, user_ids)
+    missing_ids = user_ids - scores.keys()
+    if not missing_ids:
+        return scores
+
+    rows = execute_sql(
+        f"""
+        SELECT
+            u2.id AS user_id,
+            (6371 * acos(cos(radians(u1_geo.latitude)) * cos(radians(u2_geo.latitude)) * cos(radians(u2_geo.longitude) - radians(u1_geo.longitude)) + sin(radians(u1_geo.latitude)) * sin(radians(u2_geo.latitude)))) AS distance,
+            (
+                SELECT COUNT(*)
+                FROM user_interests ui1
+                JOIN user_interests ui2 ON ui2.interest_id = ui1.interest_id
+                WHERE ui1.user_id = :current_user_id AND ui2.user_id = u2.id
+            ) AS common_interests_count
+        FROM users u2
+        LEFT JOIN user_geolocation u1_geo ON u1_geo.user_id = :current_user_id
+        LEFT JOIN user_geolocation u2_geo ON u2.id = u2_geo.user_id
+            {geo_filter_sql('u2_geo')}
+        WHERE u2.id = ANY(:user_ids)
+        """, params={
+            "current_user_id": current_user.id,
+            "user_ids": list(missing_ids),
+            **geo_filter_params(current_user.user_geolocation)
+        }
+    )
+
+    interests_count = len(current_user.interests)
+    new_scores = {
+        row["user_id"]: calculate_match_percentage(row["common_interests_count"], interests_count, row["distance"])
+        for row in rows
+    }
+    match_score_cache.set_many(current_user.id, new_scores)
+    scores.update(new_scores)
+    return scores
+
+
+def match_cursor_params(after: tuple = None) -> dict:
+    """
+    Параметры keyset-условия ленты: строки строго после курсора в порядке
+    (match_percentage DESC, id ASC); без курсора — с начала.
+    """
+    if after is None:
+        return {"after_percentage": None, "after_id": None}
+    return {"after_percentage": after[0], "after_id": after[1]}
+
+
+def encode_match_cursor(match_percentage: float, user_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{match_percentage!r}:{user_id}".encode()).decode()
+
+
+def decode_match_cursor(cursor: str) -> tuple:
+    # Ошибки base64, декодирования и разбора — подклассы ValueError
+    match_percentage, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+    match_percentage = float(match_percentage)
+    # nan/inf разбираются float(), но с ними ни одна строка не пройдёт сравнение с курсором
+    if not math.isfinite(match_percentage):
+        raise ValueError(f"Invalid match percentage in cursor: {match_percentage}")
+    return match_percentage, int(user_id)
+
+
+class CandidateIndex:
+    """
+    Индекс кандидатов для ленты знакомств.
+
+    Пользователи разложены по корзинам (город, пол) и (ячейка геосетки, пол), поэтому запрос
+    ленты не сканирует всю таблицу users. Корзина читается из БД при первом обращении и
+    перечитывается, когда старше ttl секунд: изменения из других процессов (воркеры uvicorn,
+    socket_app, admin_app, массовые update/delete) попадают в индекс не позже чем через ttl.
+    Изменения, закоммиченные в этом процессе, применяются сразу по событиям сессии.
+    Корзин в памяти не больше max_buckets, давно не использованные вытесняются.
+
+    Индекс — только префильтр: удалённых, лайкнутых и дизлайкнутых пользователей
+    окончательно отсекает запрос ленты по актуальным данным БД.
+    """
+
+    def __init__(self, ttl: int, max_buckets: int):
+        self._ttl = ttl
+        self._max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # ("city", city_id) | ("cell", geo_cell) -> (expires_at, {gender: set(user_id)})
+        self._memberships = {}  # user_id -> {ключ корзины: gender} для пользователей из загруженных корзин
+
+    def get_candidates(self, db: Session, user_id: int, city_id: int, gender: str, cells: list = ()) -> set:
+        keys = [("city", city_id)] + [("cell", cell) for cell in cells]
+        now = time.monotonic()
+        with self._lock:
+            fresh = {}
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is not None and bucket[0] > now:
+                    self._buckets.move_to_end(key)
+                    fresh[key] = bucket[1]
+        stale = [key for key in keys if key not in fresh]
+
+        # Чтение из БД — без блокировки: холодная корзина не задерживает ни запросы по другим
+        # корзинам, ни применение коммитов (after_commit выполняется и в цикле событий)
+        loaded = {}
+        stale_cities = [key[1] for key in stale if key[0] == "city"]
+        stale_cells = [key[1] for key in stale if key[0] == "cell"]
+        if stale_cities:
+            loaded.update(self._read_city(db, stale_cities[0]))
+        if stale_cells:
+            loaded.update(self._read_cells(db, stale_cells))
+
+        with self._lock:
+            # Изменение, применённое между чтением и сохранением корзины, может потеряться
+            # до её следующего перечитывания — не дольше ttl, как и изменения из других процессов
+            for key, members in loaded.items():
+                self._store(key, members, now)
+            candidates = set()
+            for members in list(fresh.values()) + list(loaded.values()):
+                for bucket_gender, member_ids in members.items():
+                    if bucket_gender != gender:
+                        candidates |= member_ids
+            self._evict()
+
+        candidates.discard(user_id)
+        return candidates
+
+    def apply(self, changes: list):
+        with self._lock:
+            for change in changes:
+                kind = change[0]
+                if kind == "user":
+                    self._apply_user(*change[1:])
+                elif kind == "geo":
+                    self._apply_geo(*change[1:])
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._memberships.clear()
+
+    def _store(self, key, members: dict, now: float):
+        self._drop(key)
+        self._buckets[key] = (now + self._ttl, members)
+        for gender, user_ids in members.items():
+            for member_id in user_ids:
+                self._memberships.setdefault(member_id, {})[key] = gender
+
+    def _drop(self, key):
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            return
+        for user_ids in bucket[1].values():
+            for member_id in user_ids:
+                membership = self._memberships.get(member_id)
+                if membership is not None:
+                    membership.pop(key, None)
+                    if not membership:
+                        del self._memberships[member_id]
+
+    def _evict(self):
+        # Корзины текущего запроса только что переставлены в конец и вытесняются последними
+        while len(self._buckets) > self._max_buckets:
+            self._drop(next(iter(self._buckets)))
+
+    def _read_city(self, db: Session, city_id: int) -> dict:
+        members = {}
+        rows = db.query(User.id, User.gender).filter(User.city_id == city_id, User.deleted.is_(False)).all()
+        for member_id, gender in rows:
+            members.setdefault(gender, set()).add(member_id)
+        return {("city", city_id): members}
+
+    def _read_cells(self, db: Session, cells: list) -> dict:
+        members = {cell: {} for cell in cells}
+        rows = db.query(UserGeolocation.user_id, UserGeolocation.geo_cell, User.gender).join(
+            User, User.id == UserGeolocation.user_id
+        ).filter(UserGeolocation.geo_cell.in_(cells), User.deleted.is_(False)).all()
+        for member_id, cell, gender in rows:
+            members[cell].setdefault(gender, set()).add(member_id)
+        return {("cell", cell): cell_members for cell, cell_members in members.items()}
+
+    def _remove_member(self, user_id: int, kinds=("city", "cell")) -> dict:
+        membership = self._memberships.get(user_id, {})
+        removed = {key: gender for key, gender in membership.items() if key[0] in kinds}
+        for key, gender in removed.items():
+            self._buckets[key][1].get(gender, set()).discard(user_id)
+            del membership[key]
+        if not membership:
+            self._memberships.pop(user_id, None)
+        return removed
+
+    def _add_member(self, user_id: int, key, gender: str):
+        if key in self._buckets:
+            self._buckets[key][1].setdefault(gender, set()).add(user_id)
+            self._memberships.setdefault(user_id, {})[key] = gender
+
+    def _apply_user(self, user_id: int, city_id: int, gender: str, active: bool):
+        removed = self._remove_member(user_id)
+        if not active:
+            return
+        self._add_member(user_id, ("city", city_id), gender)
+        # Ячейка пользователя не меняется вместе с профилем
+        for key in removed:
+            if key[0] == "cell":
+                self._add_member(user_id, key, gender)
+
+    def _apply_geo(self, user_id: int, cell: str):
+        membership = self._memberships.get(user_id, {})
+        gender = next(iter(membership.values()), None)
+        self._remove_member(user_id, kinds=("cell",))
+
+        key = ("cell", cell)
+        if key not in self._buckets:
+            return
+        if gender is not None:
+            self._add_member(user_id, key, gender)
+        else:
+            # Пол пользователя неизвестен — ячейка будет перечитана при следующем обращении
+            self._drop(key)
+
+
+candidate_index = CandidateIndex(CANDIDATE_INDEX_TTL, CANDIDATE_INDEX_MAX_BUCKETS)
+
+_PENDING_CHANGES_KEY = "candidate_index_changes"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_candidate_changes(session, flush_context):
+    # Изменения копятся до коммита: после отката индекс трогать нельзя
+    changes = session.info.setdefault(_PENDING_CHANGES_KEY, [])
+
+    for obj in session.new | session.dirty:
+        if isinstance(obj, User):
+            changes.append(("user", obj.id, obj.city_id, obj.gender, obj.deleted is False))
+        elif isinstance(obj, UserGeolocation):
+            changes.append(("geo", obj.user_id, obj.geo_cell))
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            changes.append(("user", obj.id, None, None, False))
+        elif isinstance(obj, UserGeolocation):
+            changes.append(("geo", obj.user_id, None))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_candidate_changes(session):
+    changes = session.info.pop(_PENDING_CHANGES_KEY, None)
+    if changes:
+        candidate_index.apply(changes)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_candidate_changes(session, previous_transaction):
+    session.info.pop(_PENDING_CHANGES_KEY, None)
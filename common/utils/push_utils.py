@@ -0,0 +1,103 @@
+import asyncio
+
+from config import logger, PUSH_QUEUE_SIZE, PUSH_WORKERS, PUSH_MAX_ATTEMPTS, PUSH_RETRY_DELAY
+from common.utils.service_utils import push_batcher, PushRetryableError, RETRYABLE_PUSH_ERRORS
+from common.utils.user_utils import get_user_push_token
+
+
+class PushDispatcher:
+    """
+    Фоновая отправка пушей: задачи кладутся в ограниченную очередь и выполняются
+    несколькими воркерами, поэтому обработчик не ждёт поиска токена и запроса к push_app.
+    Упавшая задача повторяется с растущей паузой до max_attempts раз.
+    """
+
+    def __init__(self, workers: int, queue_size: int, max_attempts: int, retry_delay: float):
+        self._workers_count = workers
+        self._queue_size = queue_size
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._queue = None
+        self._workers = []
+        # Ссылки на ожидающие повторы: без них задачу может собрать сборщик мусора
+        self._retries = set()
+
+    def submit(self, job, *args, **kwargs) -> bool:
+        """
+        Ставит корутинную функцию job(*args, **kwargs) в очередь. Возвращает False, если очередь переполнена.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((job, args, kwargs, 1))
+        except asyncio.QueueFull:
+            logger.error(f"Push queue is full, dropping {getattr(job, '__name__', job)}")
+            return False
+        return True
+
+    async def stop(self):
+        # Дожидаемся уже поставленных задач и их повторов, затем останавливаем воркеров
+        if self._queue is None:
+            return
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                break
+            await asyncio.gather(*self._retries, return_exceptions=True)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def _ensure_started(self):
+        # Воркеры создаются в работающем цикле событий при первой задаче
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self._workers_count)]
+
+    async def _worker(self):
+        while True:
+            job, args, kwargs, attempt = await self._queue.get()
+            try:
+                await job(*args, **kwargs)
+            except Exception as e:
+                if attempt < self._max_attempts:
+                    logger.warning(f"Push job {job.__name__} failed (attempt {attempt}): {e}, retrying")
+                    retry = asyncio.get_running_loop().create_task(self._retry(job, args, kwargs, attempt))
+                    self._retries.add(retry)
+                    retry.add_done_callback(self._retries.discard)
+                else:
+                    logger.error(f"Push job {job.__name__} failed after {attempt} attempts: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _retry(self, job, args, kwargs, attempt: int):
+        await asyncio.sleep(self._retry_delay * 2 ** (attempt - 1))
+        try:
+            self._queue.put_nowait((job, args, kwargs, attempt + 1))
+        except asyncio.QueueFull:
+            logger.error(f"Push queue is full, dropping retry of {job.__name__}")
+
+
+push_dispatcher = PushDispatcher(PUSH_WORKERS, PUSH_QUEUE_SIZE, PUSH_MAX_ATTEMPTS, PUSH_RETRY_DELAY)
+
+
+async def notify_user(user_id: int, title: str, body: str, data: dict, aps: dict):
+    """
+    Отправляет пуш пользователю, если у него есть токен. Пуши, поставленные одновременно,
+    уходят одной пачкой через /send_push_batch; недействительные токены отключаются.
+    Ошибки сети и временные ошибки push_app/FCM пробрасываются, чтобы диспетчер повторил отправку.
+    """
+    push_token = await get_user_push_token(user_id)
+    if not push_token:
+        logger.info(f"Push token for user {user_id} not found")
+        return
+    # aps в PushMessage не входит: push_app собирает уведомление из title/body/data
+    result = await push_batcher.send({"token": push_token, "title": title, "body": body, "data": data})
+    if result is None or result["success"]:
+        return
+    logger.error(f"Failed to send push notification to user {user_id}: {result.get('error')}")
+    if result.get("error_code") in RETRYABLE_PUSH_ERRORS:
+        raise PushRetryableError(f"FCM responded with {result['error_code']}")
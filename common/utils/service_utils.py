@@ -1,14 +1,70 @@
-import json
+import asyncio
+
 from fastapi.security import HTTPBearer
 from socketio import AsyncClient
-from config import logger
+from config import (
+    logger,
+    PUSH_APP_URL,
+    PUSH_HTTP_TIMEOUT,
+    PUSH_HTTP_MAX_CONNECTIONS,
+    PUSH_HTTP_KEEPALIVE_CONNECTIONS,
+    PUSH_HTTP_KEEPALIVE_EXPIRY,
+    PUSH_BATCH_MAX_SIZE,
+    PUSH_BATCH_DELAY
+)
 import httpx
+from common.utils.user_utils import deactivate_push_tokens
 
 security = HTTPBearer()
 sio_client = AsyncClient()
 
-async def send_push_notification(token, title, body, data, aps):
-    url = "http://push_app:1026/send_push"
+# Коды ошибок FCM (error_code из ответа push_app), после которых отправку стоит повторить
+RETRYABLE_PUSH_ERRORS = {"unavailable", "internal", "resource_exhausted", "deadline_exceeded"}
+
+
+class PushRetryableError(Exception):
+    """
+    Временная ошибка отправки пуша: push_app или FCM недоступны, повтор может пройти.
+    """
+
+
+# Один клиент на процесс: соединения с push_app переиспользуются (keep-alive)
+push_http_client = None
+
+
+def get_push_http_client() -> httpx.AsyncClient:
+    global push_http_client
+    if push_http_client is None or push_http_client.is_closed:
+        push_http_client = httpx.AsyncClient(
+            base_url=PUSH_APP_URL,
+            timeout=httpx.Timeout(PUSH_HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=PUSH_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=PUSH_HTTP_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=PUSH_HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+    return push_http_client
+
+
+async def start_push_http_client():
+    # Хук старта приложения: пул создаётся заранее, а не на первом пуше
+    get_push_http_client()
+
+
+async def close_push_http_client():
+    # Хук остановки приложения: закрываем соединения пула
+    global push_http_client
+    if push_http_client is not None:
+        await push_http_client.aclose()
+        push_http_client = None
+
+
+async def send_push_notification(token, title, body, data, aps, raise_on_retryable: bool = False):
+    """
+    Отправка пуша через push_app. При ошибке возвращает None; с raise_on_retryable временные
+    ошибки (5xx, 429, недоступность FCM) поднимают PushRetryableError для повтора вызывающим.
+    """
     payload = {
         "token": token,
         "title": title,
@@ -17,18 +73,117 @@ async def send_push_notification(token, title, body, data, aps):
         "aps": aps
     }
 
-    logger.info(f"Sending push notification: {json.dumps(payload, indent=2)}")
+    logger.debug(f"Sending push notification: {title}")
+
+    response = await get_push_http_client().post("/send_push", json=payload)
+
+    if response.status_code != 200:
+        logger.error(f"Failed to send push notification: {response.status_code} - {response.text}")
+        detail = _error_detail(response)
+        if detail.get("token_invalid"):
+            await deactivate_push_tokens([token])
+            logger.info(f"Push token deactivated: {token}")
+        elif raise_on_retryable and _is_retryable_response(response, detail):
+            raise PushRetryableError(f"Push app responded with {response.status_code}")
+        return None
+
+    return response.json()
+
+
+def _error_detail(response) -> dict:
+    # detail ответа push_app с ошибкой: {success, error, error_code, token_invalid}
+    try:
+        detail = response.json().get("detail")
+    except (ValueError, AttributeError):
+        return {}
+    return detail if isinstance(detail, dict) else {}
+
+
+def _is_retryable_response(response, detail: dict) -> bool:
+    if response.status_code >= 500 or response.status_code == 429:
+        return True
+    return detail.get("error_code") in RETRYABLE_PUSH_ERRORS
+
+
+async def send_push_notifications_batch(messages):
+    """
+    Рассылка одним запросом к push_app: messages — список словарей с полями PushMessage.
+    Возвращает ответ /send_push_batch с результатом по каждому токену или None при ошибке;
+    временная ошибка push_app поднимает PushRetryableError. Токены, которые FCM признал
+    недействительными, отключаются одним UPDATE.
+    """
+    if not messages:
+        return {"success_count": 0, "failure_count": 0, "results": []}
+
+    response = await get_push_http_client().post("/send_push_batch", json={"messages": messages})
+
+    if response.status_code != 200:
+        logger.error(f"Failed to send push batch: {response.status_code} - {response.text}")
+        if _is_retryable_response(response, _error_detail(response)):
+            raise PushRetryableError(f"Push app responded with {response.status_code}")
+        return None
+
+    result = response.json()
+    invalid_tokens = [item["token"] for item in result["results"] if item.get("token_invalid")]
+    if invalid_tokens:
+        deactivated = await deactivate_push_tokens(invalid_tokens)
+        logger.info(f"Deactivated {deactivated} invalid push tokens")
+    return result
+
+
+class PushBatcher:
+    """
+    Склеивает пуши, поставленные почти одновременно, в один запрос /send_push_batch:
+    пачка уходит через max_delay секунд после первого пуша или сразу по набору max_size.
+    send возвращает PushResult этого токена в виде словаря (None, если пачка не отправилась).
+    """
+
+    def __init__(self, max_size: int, max_delay: float):
+        self._max_size = max_size
+        self._max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        # Ссылки на отправляемые пачки: без них задачу может собрать сборщик мусора
+        self._flushes = set()
+
+    async def send(self, message: dict):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, future))
+        if len(self._pending) >= self._max_size:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._max_delay, self._on_timer)
+        return await future
+
+    def _on_timer(self):
+        self._timer = None
+        self._start_flush()
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=payload)
+    def _start_flush(self):
+        batch, self._pending = self._pending, []
+        flush = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
 
-        logger.info(f"Received response: {response.status_code} - {response.text}")
+    async def _flush(self, batch):
+        try:
+            result = await send_push_notifications_batch([message for message, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # push_app возвращает результаты в порядке сообщений
+        results = result["results"] if result else [None] * len(batch)
+        for (_, future), item in zip(batch, results):
+            if not future.done():
+                future.set_result(item)
 
-        if response.status_code != 200:
-            logger.error(f"Failed to send push notification: {response.status_code}")
-            return None
 
-        return response.json()
+push_batcher = PushBatcher(PUSH_BATCH_MAX_SIZE, PUSH_BATCH_DELAY)
 
 
 async def send_event_to_socketio(url, event_name, event_data):
@@ -0,0 +1,492 @@
+import asyncio
+import functools
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from config import (
+    logger,
+    s3_client,
+    BUCKET_MESSAGE_IMAGES,
+    BUCKET_MESSAGE_VOICES,
+    BUCKET_PROFILE_IMAGES,
+    STORAGE_URL,
+    STORAGE_CONCURRENCY,
+    STORAGE_READ_CHUNK_SIZE,
+    S3_MULTIPART_THRESHOLD,
+    S3_MULTIPART_CHUNK_SIZE,
+    S3_UPLOAD_CONCURRENCY,
+    MEDIA_URL_MODE,
+    MEDIA_URL_TTL,
+    MEDIA_URL_REFRESH_MARGIN,
+    MEDIA_URL_CACHE_SIZE
+)
+
+# Файлы больше порога уходят multipart-загрузкой частями по S3_MULTIPART_CHUNK_SIZE
+upload_transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+    max_concurrency=S3_UPLOAD_CONCURRENCY,
+)
+
+# Ключи файлов создаются с префиксом типа, по нему однозначно выбирается бакет.
+# Только публичные файлы: get_file и presigned-ссылки отдаются без авторизации
+KEY_PREFIX_BUCKETS = (
+    ("image_", BUCKET_MESSAGE_IMAGES),
+    ("profile_", BUCKET_PROFILE_IMAGES),
+    ("voice_", BUCKET_MESSAGE_VOICES),
+)
+
+# Приватные файлы (селфи верификации в BUCKET_VERIFY_IMAGES) наружу не отдаются
+PRIVATE_KEY_PREFIXES = ("verification_",)
+
+
+def bucket_for_key(file_key: str):
+    """
+    Бакет публичного файла по префиксу ключа; голосовые сообщения исторически хранятся под
+    именем файла клиента без префикса, поэтому всё остальное — бакет голосовых.
+    Для приватных ключей — None.
+    """
+    if file_key.startswith(PRIVATE_KEY_PREFIXES):
+        return None
+    for prefix, bucket in KEY_PREFIX_BUCKETS:
+        if file_key.startswith(prefix):
+            return bucket
+    return BUCKET_MESSAGE_VOICES
+
+
+class StorageObjectNotFound(Exception):
+    pass
+
+
+class StorageNotModified(Exception):
+    """
+    Объект не менялся с версии клиента (If-None-Match / If-Modified-Since); stored — его метаданные.
+    """
+
+    def __init__(self, stored):
+        super().__init__(stored.key)
+        self.stored = stored
+
+
+class StorageRangeNotSatisfiable(Exception):
+    def __init__(self, total_length: int = None):
+        super().__init__(total_length)
+        self.total_length = total_length
+
+
+class StoredObject:
+    """
+    Объект хранилища: метаданные и тело — асинхронный итератор по частям.
+    Для запроса диапазона content_length — длина части, content_range — "bytes start-end/total".
+    """
+
+    def __init__(self, key: str, body, content_type: str = None, content_length: int = None,
+                 etag: str = None, last_modified: datetime = None, content_range: str = None):
+        self.key = key
+        self.body = body
+        self.content_type = content_type
+        self.content_length = content_length
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_range = content_range
+
+
+def parse_byte_range(range_header: str):
+    """
+    Разбирает заголовок Range с одним диапазоном: "bytes=a-b", "bytes=a-" или "bytes=-n".
+    Возвращает (start, end), где start=None означает последние end байт;
+    для нескольких диапазонов и неизвестного формата — None (отдаём файл целиком).
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    start, end = (part.strip() for part in spec.split("-", 1))
+    if not (start.isdigit() or start == "") or not (end.isdigit() or end == "") or start == end == "":
+        return None
+    start = int(start) if start else None
+    end = int(end) if end else None
+    if start is not None and end is not None and end < start:
+        return None
+    return start, end
+
+
+def resolve_byte_range(byte_range: tuple, total_length: int) -> tuple:
+    # (start, end) включительно в пределах объекта
+    start, end = byte_range
+    if start is None:
+        if end == 0 or total_length == 0:
+            raise StorageRangeNotSatisfiable(total_length)
+        return max(total_length - end, 0), total_length - 1
+    if start >= total_length:
+        raise StorageRangeNotSatisfiable(total_length)
+    return start, total_length - 1 if end is None else min(end, total_length - 1)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Слабое сравнение, как положено для If-None-Match
+    if not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+class BaseStorage:
+    """
+    Асинхронный интерфейс к хранилищу файлов. Блокирующие операции бэкенда выполняются
+    в собственном пуле из max_concurrency потоков: больше одновременных запросов к хранилищу
+    не бывает, и они не занимают ни цикл событий, ни общий пул потоков FastAPI.
+    """
+
+    def __init__(self, max_concurrency: int = STORAGE_CONCURRENCY, chunk_size: int = STORAGE_READ_CHUNK_SIZE):
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="storage")
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def _iter_body(self, body):
+        # Тело читается частями в пуле хранилища, в ответ уходит по мере чтения
+        try:
+            while True:
+                chunk = await self._run(body.read, self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def upload(self, file_obj, bucket: str, key: str, content_type: str = None):
+        """
+        Загружает файловый объект (например, UploadFile.file) без копии на локальный диск.
+        """
+        file_obj.seek(0)
+        await self._run(self._upload, file_obj, bucket, key, content_type)
+        logger.info(f"File {key} uploaded successfully to bucket {bucket}")
+
+    async def download(self, bucket: str, key: str, byte_range: tuple = None,
+                       if_none_match: str = None, if_modified_since: datetime = None) -> StoredObject:
+        """
+        Открывает объект на чтение одним запросом к хранилищу.
+        byte_range — результат parse_byte_range; условия кэша проверяются тем же запросом.
+        Нет объекта — StorageObjectNotFound, не изменился — StorageNotModified,
+        диапазон за пределами объекта — StorageRangeNotSatisfiable.
+        """
+        stored, body = await self._run(self._open, bucket, key, byte_range, if_none_match, if_modified_since)
+        stored.body = self._iter_body(body)
+        return stored
+
+    def presign(self, bucket: str, key: str, expires_in: int):
+        """
+        Ссылка на объект напрямую в хранилище; None — бэкенд так не умеет, файл отдаёт get_file.
+        """
+        return None
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _upload(self, file_obj, bucket: str, key: str, content_type: str = None):
+        raise NotImplementedError
+
+    def _open(self, bucket: str, key: str, byte_range=None, if_none_match=None, if_modified_since=None) -> tuple:
+        # Возвращает (StoredObject без тела, файловый объект тела)
+        raise NotImplementedError
+
+    def _apply_conditions(self, stored: StoredObject, byte_range, if_none_match, if_modified_since):
+        """
+        Условный запрос и диапазон для локальных бэкендов. Возвращает (start, end) или None.
+        """
+        if if_none_match:
+            if etag_matches(if_none_match, stored.etag):
+                raise StorageNotModified(stored)
+        elif if_modified_since and stored.last_modified \
+                and stored.last_modified.replace(microsecond=0) <= if_modified_since:
+            raise StorageNotModified(stored)
+
+        if byte_range is None:
+            return None
+        total_length = stored.content_length
+        start, end = resolve_byte_range(byte_range, total_length)
+        stored.content_length = end - start + 1
+        stored.content_range = f"bytes {start}-{end}/{total_length}"
+        return start, end
+
+
+class S3Storage(BaseStorage):
+    """
+    S3-совместимое хранилище (Yandex Object Storage). Пул HTTP-соединений клиента
+    задаётся в config (S3_MAX_POOL_CONNECTIONS). Условия кэша и Range передаются в сам
+    get_object, поэтому 304 и частичный ответ не стоят лишнего запроса.
+    """
+
+    def __init__(self, client, transfer_config: TransferConfig = upload_transfer_config, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.transfer_config = transfer_config
+
+    def _upload(self, file_obj, bucket, key, content_type=None):
+        extra_args = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(file_obj, bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def presign(self, bucket, key, expires_in):
+        # Подпись считается локально, без запроса к хранилищу
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expires_in
+        )
+
+    def _open(self, bucket, key, byte_range=None, if_none_match=None, if_modified_since=None):
+        params = {"Bucket": bucket, "Key": key}
+        if byte_range is not None:
+            start, end = byte_range
+            params["Range"] = f"bytes={'' if start is None else start}-{'' if end is None else end}"
+        if if_none_match:
+            params["IfNoneMatch"] = if_none_match
+        elif if_modified_since:
+            params["IfModifiedSince"] = if_modified_since
+
+        try:
+            response = self.client.get_object(**params)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            headers = e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+            if code in ("NoSuchKey", "NoSuchBucket", "404"):
+                raise StorageObjectNotFound(f"{bucket}/{key}") from e
+            if code in ("304", "NotModified"):
+                last_modified = headers.get("last-modified")
+                raise StorageNotModified(StoredObject(
+                    key,
+                    None,
+                    etag=headers.get("etag"),
+                    last_modified=parsedate_to_datetime(last_modified) if last_modified else None
+                )) from e
+            if code == "InvalidRange":
+                total_length = e.response.get("Error", {}).get("ActualObjectSize")
+                raise StorageRangeNotSatisfiable(int(total_length) if total_length else None) from e
+            raise
+        stored = StoredObject(
+            key,
+            None,
+            content_type=response.get("ContentType"),
+            content_length=response.get("ContentLength"),
+            etag=response.get("ETag"),
+            last_modified=response.get("LastModified"),
+            content_range=response.get("ContentRange")
+        )
+        return stored, response["Body"]
+
+
+class MemoryStorage(BaseStorage):
+    """
+    Хранилище в памяти процесса для тестов и локального запуска.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.objects = {}  # (bucket, key) -> (bytes, content_type, last_modified)
+
+    def _upload(self, file_obj, bucket, key, content_type=None):
+        self.objects[(bucket, key)] = (file_obj.read(), content_type, datetime.now(timezone.utc))
+
+    def _open(self, bucket, key, byte_range=None, if_none_match=None, if_modified_since=None):
+        if (bucket, key) not in self.objects:
+            raise StorageObjectNotFound(f"{bucket}/{key}")
+        data, content_type, last_modified = self.objects[(bucket, key)]
+        stored = StoredObject(
+            key,
+            None,
+            content_type=content_type or mimetypes.guess_type(key)[0],
+            content_length=len(data),
+            etag=f'"{hashlib.md5(data).hexdigest()}"',
+            last_modified=last_modified
+        )
+        part = self._apply_conditions(stored, byte_range, if_none_match, if_modified_since)
+        if part is not None:
+            data = data[part[0]:part[1] + 1]
+        return stored, _BytesBody(data)
+
+
+class FilesystemStorage(BaseStorage):
+    """
+    Хранилище в каталоге root: бакет — подкаталог, ключ — имя файла.
+    """
+
+    def __init__(self, root: str, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+
+    def _path(self, bucket, key):
+        # Ключ — только имя файла, без выхода за пределы бакета
+        if not key or key != os.path.basename(key) or key in (".", ".."):
+            raise StorageObjectNotFound(f"{bucket}/{key}")
+        return os.path.join(self.root, bucket, key)
+
+    def _upload(self, file_obj, bucket, key, content_type=None):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as destination:
+            shutil.copyfileobj(file_obj, destination, self.chunk_size)
+
+    def _open(self, bucket, key, byte_range=None, if_none_match=None, if_modified_since=None):
+        path = self._path(bucket, key)
+        try:
+            body = open(path, "rb")
+        except FileNotFoundError as e:
+            raise StorageObjectNotFound(f"{bucket}/{key}") from e
+        try:
+            stat = os.fstat(body.fileno())
+            stored = StoredObject(
+                key,
+                None,
+                content_type=mimetypes.guess_type(key)[0],
+                content_length=stat.st_size,
+                etag=f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+                last_modified=datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+            )
+            part = self._apply_conditions(stored, byte_range, if_none_match, if_modified_since)
+        except Exception:
+            body.close()
+            raise
+        if part is not None:
+            body.seek(part[0])
+        return stored, _LimitedBody(body, stored.content_length)
+
+
+class _BytesBody:
+    def __init__(self, data: bytes):
+        self._data = data
+        self._position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size < 0 else self._position + size
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+class _LimitedBody:
+    # Файл, из которого читается не больше length байт (для диапазона)
+    def __init__(self, file_obj, length: int):
+        self._file_obj = file_obj
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        size = self._remaining if size < 0 else min(size, self._remaining)
+        chunk = self._file_obj.read(size)
+        self._remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self._file_obj.close()
+
+
+def create_storage(url):
+    """
+    Хранилище по URL: пусто — S3 из config, memory:// — в памяти, file:///path — каталог на диске.
+    """
+    if not url:
+        return S3Storage(s3_client)
+    if url.startswith('memory://'):
+        return MemoryStorage()
+    if url.startswith('file://'):
+        return FilesystemStorage(url[len('file://'):])
+    raise ValueError(f"Unsupported storage URL: {url}")
+
+
+storage = create_storage(STORAGE_URL)
+
+FILE_URL_PREFIX = "/service/get_file/"
+
+
+def file_key_from_url(url: str):
+    # Ключ файла из ссылки вида /service/get_file/{key} или голый ключ; внешние ссылки — None
+    if url.startswith(FILE_URL_PREFIX):
+        return url[len(FILE_URL_PREFIX):] or None
+    if "/" not in url and ":" not in url:
+        return url
+    return None
+
+
+class MediaUrlCache:
+    """
+    Кэш presigned-ссылок: ключ файла -> (ссылка, момент истечения). Ссылка отдаётся, пока до её
+    истечения больше refresh_margin секунд, поэтому у клиента всегда есть запас времени на загрузку.
+    Размер ограничен max_size (LRU). Используется и из потоков синхронных обработчиков.
+    """
+
+    def __init__(self, storage: BaseStorage, ttl: int, refresh_margin: int, max_size: int):
+        self.storage = storage
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_size = max_size
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, urls) -> dict:
+        """
+        Публичные ссылки пачкой: {исходная ссылка: presigned-ссылка}. Ссылки не на наши файлы
+        и файлы бэкендов без presign остаются как есть.
+        """
+        now = time.monotonic()
+        resolved = {}
+        with self._lock:
+            for url in urls:
+                if not url or url in resolved:
+                    continue
+                key = file_key_from_url(url)
+                if key is None:
+                    resolved[url] = url
+                    continue
+                cached = self._urls.get(key)
+                if cached and cached[1] - self.refresh_margin > now:
+                    self._urls.move_to_end(key)
+                    resolved[url] = cached[0]
+                    continue
+                bucket = bucket_for_key(key)
+                presigned = self.storage.presign(bucket, key, self.ttl) if bucket else None
+                if presigned is None:
+                    resolved[url] = url
+                    continue
+                self._urls[key] = (presigned, now + self.ttl)
+                self._urls.move_to_end(key)
+                if len(self._urls) > self.max_size:
+                    self._urls.popitem(last=False)
+                resolved[url] = presigned
+        return resolved
+
+
+media_url_cache = MediaUrlCache(storage, MEDIA_URL_TTL, MEDIA_URL_REFRESH_MARGIN, MEDIA_URL_CACHE_SIZE)
+
+
+def public_media_urls(urls) -> dict:
+    """
+    {ссылка из БД: ссылка для клиента}. В режиме MEDIA_URL_MODE=presigned файлы отдаются
+    напрямую из хранилища по короткоживущим ссылкам, иначе — через /service/get_file.
+    """
+    if MEDIA_URL_MODE != "presigned":
+        return {url: url for url in urls if url}
+    return media_url_cache.resolve(urls)
+
+
+def public_media_url(url):
+    if not url:
+        return url
+    return public_media_urls([url])[url]
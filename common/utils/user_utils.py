@@ -1,6 +1,6 @@
 import jwt
 from fastapi import Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import select, update
 from config import SECRET_KEY, AsyncSessionLocal
 from common.models import User, PushTokens
 from common.utils.auth_utils import get_token
@@ -19,13 +19,31 @@ def get_current_user(token: str = Depends(get_token)):
 
 async def get_user_push_token(user_id: int):
     async with AsyncSessionLocal() as session:
-        stmt = select(PushTokens).where(PushTokens.user_id == user_id)
+        stmt = select(PushTokens).where(PushTokens.user_id == user_id, PushTokens.active.is_(True))
         result = await session.execute(stmt)
         push_token = result.scalar_one_or_none()
         if push_token:
             return push_token.token
     return None
 
+async def deactivate_push_tokens(tokens):
+    """
+    Отключает токены, которые FCM признал недействительными; одним UPDATE на всю пачку.
+    Токен снова станет активным, когда клиент заново пришлёт его в /user/add_token.
+    """
+    tokens = list(set(tokens))
+    if not tokens:
+        return 0
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(PushTokens).where(PushTokens.token.in_(tokens), PushTokens.active.is_(True))
+            .values(active=False)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return result.rowcount
+
+
 async def get_user_name(user_id: int):
     async with AsyncSessionLocal() as session:
         stmt = select(User).where(User.id == user_id)
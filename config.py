@@ -5,8 +5,11 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 import os
+import socket
 import logging
 import boto3
+from botocore.config import Config as BotoConfig
+from common.socketio_managers import create_client_manager
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -32,12 +35,43 @@ BUCKET_PROFILE_IMAGES = os.getenv("BUCKET_PROFILE_IMAGES")
 BUCKET_VERIFY_IMAGES = os.getenv("BUCKET_VERIFY_IMAGES")
 SMS_API_KEY = os.getenv("SMS_API_KEY")
 FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
+PUSH_MESSAGING_BACKEND = os.getenv("PUSH_MESSAGING_BACKEND", "firebase")
 VERIFY_CHAT_LINK=os.getenv("VERIFY_CHAT_LINK")
 VERIFY_CHAT_ID=os.getenv("VERIFY_CHAT_ID")
 VERIFY_SEND_TEXT=os.getenv("VERIFY_SEND_TEXT")
 SMS_CENTER_LOGIN=os.getenv("SMS_CENTER_LOGIN")
 SMS_CENTER_PASSWORD=os.getenv("SMS_CENTER_PASSWORD")
-MAX_DISTANCE=os.getenv("MAX_DISTANCE")
+MAX_DISTANCE=float(os.getenv("MAX_DISTANCE", 50))
+MATCH_SCORE_CACHE_TTL=int(os.getenv("MATCH_SCORE_CACHE_TTL", 60))
+CANDIDATE_INDEX_TTL=int(os.getenv("CANDIDATE_INDEX_TTL", 60))
+CANDIDATE_INDEX_MAX_BUCKETS=int(os.getenv("CANDIDATE_INDEX_MAX_BUCKETS", 2000))
+ASYNC_DB_POOL_SIZE=int(os.getenv("ASYNC_DB_POOL_SIZE", 20))
+ASYNC_DB_MAX_OVERFLOW=int(os.getenv("ASYNC_DB_MAX_OVERFLOW", 10))
+SOCKETIO_MESSAGE_QUEUE=os.getenv("SOCKETIO_MESSAGE_QUEUE")
+SOCKETIO_NODE_ID=os.getenv("SOCKETIO_NODE_ID", socket.gethostname())
+PUSH_WORKERS=int(os.getenv("PUSH_WORKERS", 4))
+PUSH_QUEUE_SIZE=int(os.getenv("PUSH_QUEUE_SIZE", 10000))
+PUSH_MAX_ATTEMPTS=int(os.getenv("PUSH_MAX_ATTEMPTS", 3))
+PUSH_RETRY_DELAY=float(os.getenv("PUSH_RETRY_DELAY", 1))
+PUSH_BATCH_MAX_SIZE=int(os.getenv("PUSH_BATCH_MAX_SIZE", 500))
+PUSH_BATCH_DELAY=float(os.getenv("PUSH_BATCH_DELAY", 0.02))
+PUSH_APP_URL=os.getenv("PUSH_APP_URL", "http://push_app:1026")
+PUSH_HTTP_TIMEOUT=float(os.getenv("PUSH_HTTP_TIMEOUT", 10))
+PUSH_HTTP_MAX_CONNECTIONS=int(os.getenv("PUSH_HTTP_MAX_CONNECTIONS", 100))
+PUSH_HTTP_KEEPALIVE_CONNECTIONS=int(os.getenv("PUSH_HTTP_KEEPALIVE_CONNECTIONS", 20))
+PUSH_HTTP_KEEPALIVE_EXPIRY=float(os.getenv("PUSH_HTTP_KEEPALIVE_EXPIRY", 60))
+S3_MULTIPART_THRESHOLD=int(os.getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+S3_MULTIPART_CHUNK_SIZE=int(os.getenv("S3_MULTIPART_CHUNK_SIZE", 8 * 1024 * 1024))
+S3_UPLOAD_CONCURRENCY=int(os.getenv("S3_UPLOAD_CONCURRENCY", 4))
+S3_MAX_POOL_CONNECTIONS=int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+STORAGE_URL=os.getenv("STORAGE_URL")
+STORAGE_CONCURRENCY=int(os.getenv("STORAGE_CONCURRENCY", 8))
+STORAGE_READ_CHUNK_SIZE=int(os.getenv("STORAGE_READ_CHUNK_SIZE", 64 * 1024))
+FILE_CACHE_MAX_AGE=int(os.getenv("FILE_CACHE_MAX_AGE", 86400))
+MEDIA_URL_MODE=os.getenv("MEDIA_URL_MODE", "proxy")
+MEDIA_URL_TTL=int(os.getenv("MEDIA_URL_TTL", 3600))
+MEDIA_URL_REFRESH_MARGIN=int(os.getenv("MEDIA_URL_REFRESH_MARGIN", 300))
+MEDIA_URL_CACHE_SIZE=int(os.getenv("MEDIA_URL_CACHE_SIZE", 100000))
 
 # Logging configuration
 
@@ -61,14 +95,25 @@ socketio_logger.addFilter(NoPingPongFilter())
 # Database configuration
 
 engine = create_engine(DATABASE_URL)
-asyncEngine = create_async_engine(ASYNC_DATABASE_URL, echo=True)
+asyncEngine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=ASYNC_DB_POOL_SIZE,
+    max_overflow=ASYNC_DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 AsyncSessionLocal = sessionmaker(bind=asyncEngine, class_=AsyncSession, expire_on_commit=False,)
 
 Base = declarative_base()
 
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*", logger=True, engineio_logger=True)
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    client_manager=create_client_manager(SOCKETIO_MESSAGE_QUEUE),
+    cors_allowed_origins="*",
+    logger=True,
+    engineio_logger=True
+)
 socket_app = socketio.ASGIApp(sio)
 
 s3_client = boto3.client(
@@ -77,4 +122,5 @@ s3_client = boto3.client(
     aws_access_key_id=YANDEX_KEY_ID,
     aws_secret_access_key=YANDEX_KEY,
     # region_name=REGION_KEY
+    config=BotoConfig(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
 )
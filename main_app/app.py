@@ -1,6 +1,8 @@
 import os
 from fastapi import FastAPI
-from config import engine, Base
+from config import engine
+from common.migrations import run_migrations
+from common.utils import start_push_http_client, close_push_http_client, storage
 from controllers.auth_controller import router as auth_router
 from controllers.user_controller import router as user_router
 from controllers.interests_controller import router as interests_router
@@ -12,10 +14,16 @@ from controllers.service_controller import router as service_router
 
 
 app = FastAPI()
+app.add_event_handler("startup", start_push_http_client)
+app.add_event_handler("shutdown", close_push_http_client)
+app.add_event_handler("shutdown", storage.close)
 
 async def startup_event():
-    # Создание всех таблиц в базе данных при старте приложения
-    Base.metadata.create_all(bind=engine)
+    # Создание всех таблиц в базе данных при старте приложения;
+    # новые колонки и индексы существующих таблиц добавляют миграции
+    run_migrations(engine)
+
+app.add_event_handler("startup", startup_event)
 
 app.include_router(auth_router)
 app.include_router(user_router)
@@ -1,7 +1,7 @@
-import os
 import traceback
 from datetime import datetime
 import magic
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from sqlalchemy import func
 import jwt
@@ -37,9 +37,10 @@ from common.utils import (
     get_token,
     get_user_id_from_token,
     send_photos_to_bot,
-    generate_verification_code)
+    generate_verification_code,
+    storage)
 from common.utils.smsc_api import SMSC
-from config import SECRET_KEY, logger, s3_client, SessionLocal, BUCKET_VERIFY_IMAGES
+from config import SECRET_KEY, logger, SessionLocal, AsyncSessionLocal, BUCKET_VERIFY_IMAGES
 
 
 router = APIRouter(prefix="/auth", tags=["Auth Controller"])
@@ -299,9 +300,9 @@ async def upload_verify_photos(
         verification_selfie: UploadFile = File(...)):
     logger.info("Received request to upload verification photos")
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
 
         if not user:
             logger.error(f"User with id {user_id} not found")
@@ -309,7 +310,6 @@ async def upload_verify_photos(
 
         logger.info(f"User with id {user_id} found")
         first_name = user.first_name
-        db.commit()
 
     photos = [profile_photo, verification_selfie]
     photo_keys = []
@@ -342,31 +342,21 @@ async def upload_verify_photos(
         logger.info(f"Uploading file {file_name}")
 
         try:
-            # Always write the file to the buffer before uploading to S3
-            with open(file_name, "wb") as buffer:
-                buffer.write(photo.file.read())
-
-            # Upload the file to S3
-            with open(file_name, "rb") as f:
-                s3_client.upload_fileobj(f, BUCKET_VERIFY_IMAGES, file_name)
+            # Тело запроса уходит в S3 напрямую, без копии на локальный диск
+            await storage.upload(photo.file, BUCKET_VERIFY_IMAGES, file_name, content_type=mime_type)
 
             photo_keys.append(file_name)
-            logger.info(f"File {file_name} uploaded successfully to S3")
         except Exception as e:
             logger.error(f"Failed to upload file {file_name} to S3: {e}")
             raise HTTPException(status_code=500, detail="Failed to upload file")
 
         logger.info(f"Photo keys: {photo_keys}")
 
-    send_photos_to_bot(user_id, first_name, photo_keys)
+    # Бот получает те же загруженные файлы из памяти; запросы к нему блокирующие
+    bot_photos = [(file_name, photo.file) for file_name, photo in zip(photo_keys, photos)]
+    await run_in_threadpool(send_photos_to_bot, user_id, first_name, bot_photos)
 
-    # Clean up the local files
-    for file_name in photo_keys:
-        if os.path.exists(file_name):
-            os.remove(file_name)
-            logger.info(f"Local file {file_name} removed")
-
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         photo_urls = [f"/service/get_file/{key}" for key in photo_keys]
         verification_record = VerificationQueue(
             user_id=user_id,
@@ -375,6 +365,6 @@ async def upload_verify_photos(
             status='pending'
         )
         db.add(verification_record)
-        db.commit()
+        await db.commit()
 
     return {"status": "photos received, uploaded to Yandex Cloud, and sent to bot"}
\ No newline at end of file
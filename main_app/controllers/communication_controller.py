@@ -1,7 +1,9 @@
+from collections import defaultdict
 from datetime import date
 from typing import List
 from fastapi import Depends, APIRouter, HTTPException
-from common.models import Chat, Message, DateInvitations, User, UserPhoto
+from sqlalchemy import case
+from common.models import Chat, ChatSummary, DateInvitations, User, UserPhoto
 from common.schemas import (
     CreateChatRequest,
     CreateChatResponse,
@@ -10,7 +12,7 @@ from common.schemas import (
     ChatDetailsResponse,
     DateInvitationResponse
 )
-from common.utils import get_token, get_user_id_from_token
+from common.utils import get_token, get_user_id_from_token, get_avatar_urls, refresh_chat_summaries, public_media_url
 from config import SessionLocal
 
 router = APIRouter(prefix="/communication", tags=["Communication Controller"])
@@ -49,96 +51,97 @@ def get_chats(access_token: str = Depends(get_token)):
     }
     with SessionLocal() as db:
         current_user = get_user_id_from_token(access_token)
-        chats = db.query(Chat).filter(
+
+        # Чаты вместе с собеседником и сводкой текущего пользователя одним запросом
+        other_user_id = case((Chat.user1_id == current_user, Chat.user2_id), else_=Chat.user1_id)
+        rows = db.query(Chat, User, ChatSummary).join(User, User.id == other_user_id).outerjoin(
+            ChatSummary, (ChatSummary.chat_id == Chat.id) & (ChatSummary.user_id == current_user)
+        ).filter(
             ((Chat.user1_id == current_user) & (Chat.deleted_for_user1.is_(False))) |
             ((Chat.user2_id == current_user) & (Chat.deleted_for_user2.is_(False)))
         ).all()
+        if not rows:
+            return []
+
+        chats = [(chat, user) for chat, user, summary in rows]
+        summaries = {chat.id: summary for chat, user, summary in rows if summary is not None}
+
+        # Для чатов без сводки она один раз считается по сообщениям и сохраняется
+        missing_chat_ids = [chat.id for chat, user in chats if chat.id not in summaries]
+        if missing_chat_ids:
+            refresh_chat_summaries(db, current_user, missing_chat_ids)
+            summaries.update({
+                summary.chat_id: summary
+                for summary in db.query(ChatSummary).filter(
+                    ChatSummary.user_id == current_user, ChatSummary.chat_id.in_(missing_chat_ids)
+                ).all()
+            })
+
+        avatar_urls = get_avatar_urls(db, [user.id for chat, user in chats])
+
+        date_invitations = defaultdict(list)
+        for invite in db.query(DateInvitations).filter(
+            DateInvitations.recipient_id == current_user,
+            DateInvitations.status == "pending"
+        ).all():
+            date_invitations[invite.chat_id].append(
+                DateInvitationResponse(
+                    sender_id=invite.sender_id,
+                    status=invite.status
+                )
+            )
 
+        today = date.today()
         chat_responses = []
-        for chat in chats:
-            other_user_id = chat.user2_id if chat.user1_id == current_user else chat.user1_id
-            user = db.query(User).filter(User.id == other_user_id).first()
-
-            today = date.today()
+        for chat, user in chats:
             age = today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month,
                                                                                       user.date_of_birth.day))
-            avatar = db.query(UserPhoto).filter(
-                UserPhoto.user_id == other_user_id,
-                UserPhoto.is_avatar == True
-            ).first()
-
-            avatar_url = avatar.photo_url if avatar else None
-
-            date_invitations = db.query(DateInvitations).filter(
-                DateInvitations.recipient_id == current_user,
-                DateInvitations.status == "pending"
-            ).all()
 
             user2_data = UserInChat(
                 user_id=user.id,
                 first_name=user.first_name,
                 user_age=age,
                 status=user.status,
-                avatar_url=avatar_url
+                avatar_url=avatar_urls.get(user.id)
             )
 
-            # Получить последнее сообщение в чате
-            last_message = db.query(Message).filter(
-                Message.chat_id == chat.id,
-                ((Message.deleted_for_user1.is_(False)) & (chat.user1_id == current_user)) |
-                ((Message.deleted_for_user2.is_(False)) & (chat.user2_id == current_user))
-            ).order_by(
-                Message.created_at.desc()
-            ).first()
-
-            if last_message:
-                message_type = last_message.message_type.name
+            summary = summaries[chat.id]
+            if summary.last_message_id:
+                message_type = summary.last_message_type.name
                 if message_type == 'voice':
                     last_message_content = 'Голосовое сообщение'
                 elif message_type == 'image':
                     last_message_content = 'Изображение'
                 elif message_type == 'text':
-                    last_message_content = last_message.content
+                    last_message_content = summary.last_message_preview
                 else:
                     last_message_content = 'Неизвестный тип сообщения'
 
-                last_message_status = status_mapping.get(last_message.status, None)
-                last_message_sender_id = last_message.sender_id
+                last_message_status = status_mapping.get(summary.last_message_status, None)
+                last_message_sender_id = summary.last_message_sender_id
             else:
                 last_message_content = None
                 last_message_status = None
                 last_message_sender_id = None
                 message_type = None
 
-            # Получить количество непрочитанных сообщений
-            unread_count = db.query(Message).filter(
-                Message.chat_id == chat.id,
-                Message.status != 'read',
-                Message.sender_id != current_user,
-                ((Message.deleted_for_user1.is_(False)) & (chat.user1_id == current_user)) |
-                ((Message.deleted_for_user2.is_(False)) & (chat.user2_id == current_user))
-            ).count()
-
-            date_invitations_for_current_chat = [
-                DateInvitationResponse(
-                    sender_id=invite.sender_id,
-                    status=invite.status
-                ) for invite in date_invitations if invite.chat_id == chat.id]
-
             chat_response = ChatPersonResponse(
                 chat_id=chat.id,
                 user=user2_data,
                 created_at=chat.created_at,
                 last_message=last_message_content,
-                unread_count=unread_count,
+                unread_count=summary.unread_count,
                 last_message_status=last_message_status,
                 last_message_sender_id=last_message_sender_id,
                 last_message_type=message_type,
-                date_invitations=date_invitations_for_current_chat
+                date_invitations=date_invitations.get(chat.id, [])
             )
 
             chat_responses.append(chat_response)
 
+        if missing_chat_ids:
+            db.commit()
+
         return chat_responses
 
 
@@ -176,7 +179,7 @@ def modified_get_chat_details(chat_id: int, access_token: str = Depends(get_toke
             user_id=user.id,
             first_name=user.first_name,
             user_age=age,
-            avatar_url=user_avatar.photo_url if user_avatar else None,
+            avatar_url=public_media_url(user_avatar.photo_url) if user_avatar else None,
             status=user.status if user.status is not None else None
         )
 
@@ -1,6 +1,7 @@
 from fastapi import HTTPException, APIRouter, Depends
 from fastapi.responses import JSONResponse
-from config import SessionLocal, logger
+from sqlalchemy import select, delete
+from config import AsyncSessionLocal, logger
 from common.models import User, Interest, UserInterest, ErrorResponse
 from common.schemas import AddInterestsRequest, InterestResponse, UserInterestResponse
 from common.utils import get_token, get_user_id_from_token
@@ -10,15 +11,17 @@ router = APIRouter(prefix="/interest", tags=["Interests Controller"])
 
 @router.get("/user_interests", summary="Получение интересов пользователя",
             response_model=UserInterestResponse)
-def read_user_interests(access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+async def read_user_interests(access_token: str = Depends(get_token)):
+    async with AsyncSessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         # Извлечение списка интересов пользователя
-        user_interests = db.query(Interest).join(UserInterest).filter(UserInterest.user_id == user_id).all()
+        user_interests = (await db.scalars(
+            select(Interest).join(UserInterest).where(UserInterest.user_id == user_id)
+        )).all()
 
         if not user_interests:
             error_response = ErrorResponse(detail="No interests", code=622)
@@ -31,41 +34,43 @@ def read_user_interests(access_token: str = Depends(get_token)):
 
 
 @router.post("/add_interests", summary="Добавление интересов пользователя")
-def add_interests(request: AddInterestsRequest, access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+async def add_interests(request: AddInterestsRequest, access_token: str = Depends(get_token)):
+    async with AsyncSessionLocal() as db:
         try:
             user_id = get_user_id_from_token(access_token)
-            user = db.query(User).filter(User.id == user_id).first()
+            user = await db.get(User, user_id)
             if not user:
                 raise HTTPException(status_code=404, detail="Пользователь не найден")
 
             # Проверка существования интересов с данными ID
-            existing_interests = db.query(Interest).filter(Interest.id.in_(request.interest_ids)).all()
+            existing_interests = (await db.scalars(
+                select(Interest.id).where(Interest.id.in_(request.interest_ids))
+            )).all()
             if len(existing_interests) != len(request.interest_ids):
                 raise HTTPException(status_code=400, detail="Один или несколько интересов не найдены")
 
             # Удаление текущих интересов пользователя
-            db.query(UserInterest).filter(UserInterest.user_id == user_id).delete()
+            await db.execute(delete(UserInterest).where(UserInterest.user_id == user_id))
 
             # Добавление новых интересов
             for interest_id in request.interest_ids:
                 new_user_interest = UserInterest(user_id=user_id, interest_id=interest_id)
                 db.add(new_user_interest)
 
-            db.commit()
+            await db.commit()
             return {"message": "Интересы обновлены"}
 
         except Exception as e:
             print("Exception:", e)
             logger.error('Error: %s', e)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.get("/interests_list", summary="Получение списка доступных интересов", response_model=InterestResponse)
-def get_interests_list():
-    with SessionLocal() as db:
-        interests = db.query(Interest).all()
+async def get_interests_list():
+    async with AsyncSessionLocal() as db:
+        interests = (await db.scalars(select(Interest))).all()
         if not interests:
             raise HTTPException(status_code=404, detail="No interests found")
 
@@ -1,25 +1,59 @@
-from fastapi import HTTPException, APIRouter, Depends
-from typing import List
+from fastapi import HTTPException, APIRouter, Depends, Query
+from typing import Optional
 
-from common.models import User, UserPhoto, City
-from common.schemas import MatchResponse
-from common.utils import execute_sql
+from common.models import User
+from common.schemas import MatchResponse, MatchesPageResponse
+from common.utils import (
+    execute_sql,
+    candidate_index,
+    geo_filter_params,
+    geo_filter_sql,
+    MATCH_PERCENTAGE_SQL,
+    match_cursor_params,
+    encode_match_cursor,
+    decode_match_cursor,
+    get_avatar_urls,
+    get_city_names,
+    get_interest_texts
+)
 from common.utils.auth_utils import get_token, get_user_id_from_token
 from config import SessionLocal, MAX_DISTANCE
 
 router = APIRouter(prefix="/match", tags=["Matches Controller"])
 
-@router.get("/find_matches", response_model=List[MatchResponse])
-def find_matches(access_token: str = Depends(get_token)):
+@router.get("/find_matches", response_model=MatchesPageResponse)
+def find_matches(
+        limit: int = Query(20, ge=1, le=50),
+        cursor: Optional[str] = None,
+        access_token: str = Depends(get_token)):
+    after = None
+    if cursor:
+        try:
+            after = decode_match_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
     with SessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
         current_user = db.query(User).filter(User.id == user_id).first()
         if not current_user or not current_user.city_id or not current_user.gender:
             raise HTTPException(status_code=404, detail="User not found or profile incomplete")
 
-        # Извлечение потенциальных соответствий
-        potential_matches = execute_sql(
-            """
+        geo_params = geo_filter_params(current_user.user_geolocation)
+
+        # Кандидаты из индекса: город пользователя и соседние ячейки геосетки, противоположный пол.
+        # Индекс может отставать от БД на CANDIDATE_INDEX_TTL, поэтому удалённые профили,
+        # лайки и дизлайки проверяются в запросе ниже
+        candidate_ids = candidate_index.get_candidates(
+            db, user_id, current_user.city_id, current_user.gender, geo_params["geo_cells"]
+        )
+        if not candidate_ids:
+            return MatchesPageResponse(matches=[], next_cursor=None)
+
+        # Процент совпадения, порядок ленты и страница считаются в БД: запрос возвращает
+        # limit + 1 строк после курсора, лишняя показывает, есть ли следующая страница
+        page = execute_sql(
+            f"""
             WITH distances AS (
                 SELECT
                     u2.id AS potential_match_id,
@@ -29,65 +63,86 @@ def find_matches(access_token: str = Depends(get_token)):
                     u2.city_id,
                     (6371 * acos(cos(radians(u1_geo.latitude)) * cos(radians(u2_geo.latitude)) * cos(radians(u2_geo.longitude) - radians(u1_geo.longitude)) + sin(radians(u1_geo.latitude)) * sin(radians(u2_geo.latitude)))) AS distance
                 FROM users u1
-                JOIN users u2 ON u1.id != u2.id AND u1.gender != u2.gender AND u2.deleted = false
+                JOIN users u2 ON u2.id = ANY(:candidate_ids)
+                    AND u2.deleted IS FALSE
+                    AND u2.gender <> u1.gender
                 LEFT JOIN user_geolocation u1_geo ON u1.id = u1_geo.user_id
                 LEFT JOIN user_geolocation u2_geo ON u2.id = u2_geo.user_id
+                    {geo_filter_sql('u2_geo')}
                 WHERE u1.id = :current_user_id
+                    AND NOT EXISTS (
+                        SELECT 1 FROM likes l WHERE l.user_id = u1.id AND l.liked_user_id = u2.id
+                    )
+                    AND NOT EXISTS (
+                        SELECT 1 FROM dislikes dl WHERE dl.user_id = u1.id AND dl.disliked_user_id = u2.id
+                    )
+            ),
+            scored AS (
+                SELECT
+                    d.potential_match_id,
+                    d.first_name,
+                    d.date_of_birth,
+                    d.gender,
+                    d.city_id,
+                    d.distance,
+                    COUNT(ui2.interest_id) AS common_interests_count,
+                    CASE WHEN f.favorite_user_id IS NOT NULL THEN TRUE ELSE FALSE END AS is_favorite
+                FROM distances d
+                LEFT JOIN user_interests ui1 ON ui1.user_id = :current_user_id
+                LEFT JOIN user_interests ui2 ON ui2.user_id = d.potential_match_id AND ui1.interest_id = ui2.interest_id
+                LEFT JOIN favorites f ON d.potential_match_id = f.favorite_user_id AND f.user_id = :current_user_id
+                GROUP BY d.potential_match_id, d.first_name, d.date_of_birth, d.gender, d.city_id, d.distance, f.favorite_user_id
+            ),
+            ranked AS (
+                SELECT scored.*, {MATCH_PERCENTAGE_SQL} AS match_percentage
+                FROM scored
             )
-            
-            SELECT
-                d.potential_match_id,
-                d.first_name,
-                d.date_of_birth,
-                d.gender,
-                d.city_id,
-                d.distance,
-                COUNT(ui2.interest_id) AS common_interests_count,
-                CASE WHEN f.favorite_user_id IS NOT NULL THEN TRUE ELSE FALSE END AS is_favorite
-            FROM distances d
-            LEFT JOIN user_interests ui1 ON ui1.user_id = :current_user_id
-            LEFT JOIN user_interests ui2 ON ui2.user_id = d.potential_match_id AND ui1.interest_id = ui2.interest_id
-            LEFT JOIN favorites f ON d.potential_match_id = f.favorite_user_id AND f.user_id = :current_user_id
-            WHERE d.potential_match_id NOT IN (SELECT liked_user_id FROM likes WHERE user_id = :current_user_id)
-            AND d.potential_match_id NOT IN (SELECT disliked_user_id FROM dislikes WHERE user_id = :current_user_id)
-            GROUP BY d.potential_match_id, d.first_name, d.date_of_birth, d.gender, d.city_id, d.distance, f.favorite_user_id
 
-            """, params={"current_user_id": user_id}
-            )
+            SELECT *
+            FROM ranked
+            WHERE CAST(:after_percentage AS float8) IS NULL
+                OR match_percentage < :after_percentage
+                OR (match_percentage = :after_percentage AND potential_match_id > :after_id)
+            ORDER BY match_percentage DESC, potential_match_id
+            LIMIT :page_size
+            """, params={
+                "current_user_id": user_id,
+                "candidate_ids": list(candidate_ids),
+                "interests_count": len(current_user.interests),
+                "max_distance": MAX_DISTANCE,
+                "page_size": limit + 1,
+                **match_cursor_params(after),
+                **geo_params
+            }
+        )
 
-        # Формирование ответа
-        response = []
-        for match in potential_matches:
-            avatar_query = db.query(UserPhoto.photo_url).filter(
-                UserPhoto.user_id == match["potential_match_id"], UserPhoto.is_avatar == True
-                ).first()
-            avatar_url = avatar_query[0] if avatar_query else None
+        has_more = len(page) > limit
+        page = page[:limit]
 
-            interests_percentage = (match["common_interests_count"] / len(
-                current_user.interests
-                )) * 100 if current_user.interests else 0
-            distance_percentage = 100 if match["distance"] and str(match["distance"]) <= MAX_DISTANCE else 0
-            match_percentage = (interests_percentage + distance_percentage) / 2
+        match_ids = [match["potential_match_id"] for match in page]
+        avatar_urls = get_avatar_urls(db, match_ids)
+        city_names = get_city_names(db, [match["city_id"] for match in page])
+        interest_texts = get_interest_texts(db, match_ids)
 
-            response.append(
-                MatchResponse(
-                    user_id=match["potential_match_id"],
-                    first_name=match["first_name"],
-                    date_of_birth=match["date_of_birth"],
-                    gender=match["gender"],
-                    city_name=db.query(City.city_name).filter(City.id == match["city_id"]).first()[0] if match[
-                        "city_id"] else None,
-                    interests=[interest.interest.interest_text for interest in
-                               db.query(User).filter(User.id == match["potential_match_id"]).first().interests],
-                    avatar_url=avatar_url,
-                    match_percentage=match_percentage,
-                    is_favorite=match["is_favorite"]
-                )
+        # Формирование ответа
+        matches = [
+            MatchResponse(
+                user_id=match["potential_match_id"],
+                first_name=match["first_name"],
+                date_of_birth=match["date_of_birth"],
+                gender=match["gender"],
+                city_name=city_names.get(match["city_id"]),
+                interests=interest_texts.get(match["potential_match_id"], []),
+                avatar_url=avatar_urls.get(match["potential_match_id"]),
+                match_percentage=match["match_percentage"],
+                is_favorite=match["is_favorite"]
             )
+            for match in page
+        ]
 
-            response = sorted(response, key=lambda x: x.match_percentage, reverse=True)
-
-    return response
-
-
+        next_cursor = None
+        if has_more:
+            last_match = page[-1]
+            next_cursor = encode_match_cursor(last_match["match_percentage"], last_match["potential_match_id"])
 
+    return MatchesPageResponse(matches=matches, next_cursor=next_cursor)
@@ -1,24 +1,32 @@
-import os
+import mimetypes
 import traceback
 import magic
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import Optional, List, Union
-from fastapi import UploadFile, File, APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import UploadFile, File, APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+from sqlalchemy import select, update
 from common.models import City, Region, User, UserPhoto, VerificationQueue
 from common.schemas import VerificationUpdate, VerificationStatus
 from common.utils import (
     send_push_notification,
     get_user_push_token,
     get_user_id_from_token,
-    get_token
+    get_token,
+    storage,
+    StorageObjectNotFound,
+    StorageNotModified,
+    StorageRangeNotSatisfiable,
+    bucket_for_key,
+    parse_byte_range
 )
 from config import (
-    s3_client,
     BUCKET_MESSAGE_IMAGES,
     BUCKET_MESSAGE_VOICES,
     BUCKET_PROFILE_IMAGES,
-    SessionLocal,
+    FILE_CACHE_MAX_AGE,
+    AsyncSessionLocal,
     logger)
 
 router = APIRouter(prefix="/service", tags=["Auth Controller"])
@@ -32,16 +40,15 @@ async def upload_message_image(
         tag: Optional[str] = None):
     logger.info(f"Received request to upload image for chat_id {chat_id}")
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
 
         if not user:
             logger.error(f"User with id {user_id} not found")
             raise HTTPException(status_code=404, detail="Пользователь не найден")
 
         logger.info(f"User with id {user_id} found")
-        db.commit()
 
     mime = magic.Magic(mime=True)
     mime_type = mime.from_buffer(file.file.read(1024))
@@ -70,23 +77,11 @@ async def upload_message_image(
     logger.info(f"Uploading file {file_name}")
 
     try:
-        # Always write the file to the buffer before uploading to S3
-        with open(file_name, "wb") as buffer:
-            buffer.write(file.file.read())
-
-        # Upload the file to S3
-        with open(file_name, "rb") as f:
-            s3_client.upload_fileobj(f, BUCKET_MESSAGE_IMAGES, file_name)
-
-        logger.info(f"File {file_name} uploaded successfully to S3")
+        # Тело запроса уходит в S3 напрямую, без копии на локальный диск
+        await storage.upload(file.file, BUCKET_MESSAGE_IMAGES, file_name, content_type=mime_type)
     except Exception as e:
         logger.error(f"Failed to upload file {file_name} to S3: {e}")
         raise HTTPException(status_code=500, detail="Failed to upload file")
-    finally:
-        # Clean up the local file whether the upload was successful or not
-        if os.path.exists(file_name):
-            os.remove(file_name)
-            logger.info(f"Local file {file_name} removed")
 
     return {"file_key": file_name}
 
@@ -98,16 +93,15 @@ async def upload_message_voice(
         access_token: str = Depends(get_token)):
     logger.info(f"Received request to upload voice message for chat_id {chat_id}")
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
 
         if not user:
             logger.error(f"User with id {user_id} not found")
             raise HTTPException(status_code=404, detail="Пользователь не найден")
 
         logger.info(f"User with id {user_id} found")
-        db.commit()
 
     # Ensure the filename is safe
     file_name = "".join([c for c in file.filename if c.isalnum() or c in ('.', '_')])
@@ -115,29 +109,19 @@ async def upload_message_voice(
         logger.error(f"Invalid file name {file.filename}")
         raise HTTPException(status_code=400, detail="Invalid file name")
 
+    # Имя клиента не должно совпасть с префиксом другого типа файлов, иначе get_file уйдёт не в тот бакет
+    # или сочтёт файл приватным
+    if bucket_for_key(file_name) != BUCKET_MESSAGE_VOICES:
+        file_name = f"voice_{file_name}"
+
     logger.info(f"Uploading file {file_name}")
 
     try:
-        # Always write the file to the buffer before uploading to S3
-        with open(file_name, "wb") as buffer:
-            buffer.write(file.file.read())
-
-        # Upload the file to S3
-        with open(file_name, "rb") as f:
-            s3_client.upload_fileobj(f, BUCKET_MESSAGE_VOICES, file_name)
-
-        logger.info(f"File {file_name} uploaded successfully to S3")
-    except FileNotFoundError as e:
-        logger.error(f"File {file_name} not found: {e}")
-        raise HTTPException(status_code=404, detail="File not found")
+        # Тело запроса уходит в S3 напрямую, без копии на локальный диск
+        await storage.upload(file.file, BUCKET_MESSAGE_VOICES, file_name, content_type=file.content_type)
     except Exception as e:
         logger.error(f"Failed to upload file {file_name} to S3: {e}")
         raise HTTPException(status_code=500, detail="Failed to upload file")
-    finally:
-        # Clean up the local file whether the upload was successful or not
-        if os.path.exists(file_name):
-            os.remove(file_name)
-            logger.info(f"Local file {file_name} removed")
 
     return {"file_key": file_name}
 
@@ -150,18 +134,19 @@ async def upload_profile_image(
     if isinstance(is_avatar, str):
         is_avatar = is_avatar.lower() in ['true', '1', 'yes']
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
 
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
 
         if is_avatar:
-            current_avatar = db.query(UserPhoto).filter_by(user_id=user_id, is_avatar=True).first()
-            if current_avatar:
-                current_avatar.is_avatar = False
-                db.commit()
+            await db.execute(
+                update(UserPhoto).where(UserPhoto.user_id == user_id, UserPhoto.is_avatar.is_(True))
+                .values(is_avatar=False)
+            )
+            await db.commit()
 
         mime = magic.Magic(mime=True)
         mime_type = mime.from_buffer(file.file.read(1024))
@@ -186,57 +171,115 @@ async def upload_profile_image(
         file_name = f"profile_{user_id}_{timestamp}.{extension}"
 
         try:
-            with open(file_name, "wb") as buffer:
-                buffer.write(file.file.read())
-
-            with open(file_name, "rb") as f:
-                s3_client.upload_fileobj(f, BUCKET_PROFILE_IMAGES, file_name)
+            await storage.upload(file.file, BUCKET_PROFILE_IMAGES, file_name, content_type=mime_type)
 
             photo_url = f"/service/get_file/{file_name}"
             new_photo = UserPhoto(
                 user_id=user_id, photo_url=photo_url, is_avatar=is_avatar)
             db.add(new_photo)
-            db.commit()
+            await db.commit()
 
             photo_id = new_photo.id
 
         except Exception as e:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to upload file")
-        finally:
-            if os.path.exists(file_name):
-                os.remove(file_name)
 
     return {"id": photo_id, "file_key": file_name}
 
 
+def _file_headers(stored) -> dict:
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"public, max-age={FILE_CACHE_MAX_AGE}"
+    }
+    if stored.etag:
+        headers["ETag"] = stored.etag
+    if stored.last_modified:
+        headers["Last-Modified"] = format_datetime(stored.last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def _file_media_type(stored) -> str:
+    # Файлы, загруженные до сохранения ContentType, лежат как octet-stream — определяем тип по расширению
+    if stored.content_type and stored.content_type not in ("binary/octet-stream", "application/octet-stream"):
+        return stored.content_type
+    return mimetypes.guess_type(stored.key)[0] or "application/octet-stream"
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
 @router.get("/get_file/{file_key}")
-async def get_file(file_key: str):
+async def get_file(
+        file_key: str,
+        range_header: Optional[str] = Header(None, alias="Range"),
+        if_range: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None)):
+    # Бакет определяется префиксом ключа — ровно один запрос к хранилищу
+    bucket = bucket_for_key(file_key)
+    if bucket is None:
+        # Приватный файл: отвечаем так же, как на отсутствующий
+        raise HTTPException(status_code=404, detail=f"File with key {file_key} not found")
+
+    # If-Range без совпадения проверить заранее нельзя — тогда отдаём файл целиком
+    byte_range = parse_byte_range(range_header) if not if_range else None
 
-    BUCKETS = [BUCKET_MESSAGE_IMAGES, BUCKET_MESSAGE_VOICES, BUCKET_PROFILE_IMAGES]
+    try:
+        stored = await storage.download(
+            bucket,
+            file_key,
+            byte_range=byte_range,
+            if_none_match=if_none_match,
+            if_modified_since=_parse_http_date(if_modified_since)
+        )
+    except StorageObjectNotFound:
+        raise HTTPException(status_code=404, detail=f"File with key {file_key} not found")
+    except StorageNotModified as e:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_file_headers(e.stored))
+    except StorageRangeNotSatisfiable as e:
+        total_length = "*" if e.total_length is None else e.total_length
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{total_length}"}
+        )
+    except Exception as e:
+        logger.error(f"Failed to read file {file_key} from bucket {bucket}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read file")
 
-    for bucket in BUCKETS:
-        try:
-            file_obj = s3_client.get_object(Bucket=bucket, Key=file_key)
-            return StreamingResponse(
-                file_obj['Body'],
-                media_type="application/octet-stream",
-                headers={"Content-Disposition": f"attachment; filename={file_key}"}
-                )
-        except Exception as e:
-            logger.error(f"File not found in bucket {bucket}: {e}")
+    headers = _file_headers(stored)
+    headers["Content-Disposition"] = f"attachment; filename={file_key}"
+    if stored.content_length is not None:
+        headers["Content-Length"] = str(stored.content_length)
+    if stored.content_range:
+        headers["Content-Range"] = stored.content_range
 
-    raise HTTPException(status_code=404, detail=f"File with key {file_key} not found in any bucket")
+    return StreamingResponse(
+        stored.body,
+        status_code=status.HTTP_206_PARTIAL_CONTENT if stored.content_range else status.HTTP_200_OK,
+        media_type=_file_media_type(stored),
+        headers=headers
+        )
 
 
 @router.get("/cities", response_model=List[str])
 async def get_cities(query: str):
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         try:
             query = query.lower().strip()
             query = "%" + query + "%"
 
-            results = db.query(City.city_name, City.region_id, Region.name).join(Region, City.region_id == Region.id)\
-                .filter(City.city_name.ilike(query)).limit(5).all()
+            results = (await db.execute(
+                select(City.city_name, City.region_id, Region.name).join(Region, City.region_id == Region.id)
+                .where(City.city_name.ilike(query)).limit(5)
+            )).all()
 
             if not results:
                 raise HTTPException(
@@ -269,7 +312,7 @@ async def get_cities(query: str):
 async def update_verification_status(
         user_id: int,
         verification_update: VerificationUpdate) -> JSONResponse:
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         # verification = db.query(VerificationQueue).filter(VerificationQueue.user_id == user_id).first()
 
         # if not verification:
@@ -279,7 +322,7 @@ async def update_verification_status(
         # verification.status = verification_update.status.value
         # db.commit()
 
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
 
         if not user:
             logger.error("User not found")
@@ -304,7 +347,7 @@ async def update_verification_status(
             logger.error("Invalid status")
             raise HTTPException(status_code=400, detail="Invalid status")
 
-        db.commit()
+        await db.commit()
 
         # Send push notification here
         push_token = await get_user_push_token(user_id)
@@ -346,8 +389,8 @@ async def update_verification_status(
 async def send_sos_push(access_token: str = Depends(get_token)) -> JSONResponse:
     user_id = get_user_id_from_token(access_token)
 
-    with SessionLocal() as db:
-        user = db.query(User).filter(User.id == user_id).first()
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
 
     if not user:
         logger.error("User not found")
@@ -6,13 +6,16 @@ from fastapi import HTTPException, APIRouter, Depends, status
 from fastapi.responses import Response
 from typing import List, Optional
 
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from common.models import City, User, PushTokens, UserPhoto, UserGeolocation, Interest, UserInterest, Favorite
 from common.utils import (
     get_token,
     get_user_id_from_token,
-    delete_user_and_related_data
+    delete_user_and_related_data,
+    geo_cell,
+    public_media_url,
+    public_media_urls
 )
 from common.schemas import (
     UserDataResponse,
@@ -23,32 +26,32 @@ from common.schemas import (
     UserPhotosResponse,
     AddGeolocationRequest
 )
-from config import SessionLocal, logger, MAX_DISTANCE
+from config import SessionLocal, AsyncSessionLocal, logger, MAX_DISTANCE
 
 router = APIRouter(prefix="/user", tags=["User Controller"])
 @router.get("/me", response_model=PersonalUserDataResponse, summary="Получение информации о текущем пользователе")
 async def get_current_user(access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
-        user = db.query(User).filter(User.id == user_id).one_or_none()
+        user = await db.get(User, user_id)
 
         if user is None:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-        city_name = db.query(City.city_name).filter(City.id == user.city_id).scalar()
+        city_name = await db.scalar(select(City.city_name).where(City.id == user.city_id))
 
-        interests_data = db.query(Interest.id, Interest.interest_text).join(
-            UserInterest, UserInterest.interest_id == Interest.id
-        ).filter(UserInterest.user_id == user_id).all()
+        interests_data = (await db.execute(
+            select(Interest.id, Interest.interest_text).join(
+                UserInterest, UserInterest.interest_id == Interest.id
+            ).where(UserInterest.user_id == user_id)
+        )).all()
 
         interests = [InterestResponseUser(interest_id=id, interest_text=text) for id, text in interests_data]
 
-        avatar = db.query(UserPhoto).filter(
+        avatar_url = await db.scalar(select(UserPhoto.photo_url).where(
             UserPhoto.user_id == user_id,
             UserPhoto.is_avatar.is_(True)
-        ).first()
-
-        avatar_url = avatar.photo_url if avatar else None
+        ).limit(1))
 
         return {
             "id": user.id,
@@ -61,7 +64,7 @@ async def get_current_user(access_token: str = Depends(get_token)):
             "interests": interests if interests else None,
             "about_me": user.about_me,
             "status": user.status,
-            "avatar_url": avatar_url,
+            "avatar_url": public_media_url(avatar_url),
             "deleted": user.deleted
         }
 
@@ -184,15 +187,15 @@ def add_random_avatars_to_users():
 
 
 @router.post("/add_token", summary="Добавление или обновление токена пользователя")
-def add_token(request: AddTokenRequest, access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+async def add_token(request: AddTokenRequest, access_token: str = Depends(get_token)):
+    async with AsyncSessionLocal() as db:
         try:
             user_id = get_user_id_from_token(access_token)
-            user = db.query(User).filter(User.id == user_id).first()
+            user = await db.get(User, user_id)
             if not user:
                 raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-            existing_push_token = db.query(PushTokens).filter(PushTokens.user_id == user_id).first()
+            existing_push_token = await db.scalar(select(PushTokens).where(PushTokens.user_id == user_id).limit(1))
 
             if existing_push_token:
                 # Обновление существующего токена
@@ -205,13 +208,13 @@ def add_token(request: AddTokenRequest, access_token: str = Depends(get_token)):
                 db.add(new_push_token)
                 message = "Токен добавлен"
 
-            db.commit()
+            await db.commit()
             return {"message": message}
 
         except Exception as e:
             print("Exception:", e)
             logger.error('Error: %s', e)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
@@ -237,10 +240,10 @@ def delete_user(access_token: str = Depends(get_token)):
 
 @router.put("/update_user", status_code=201, summary="Обновление данных пользователя")
 async def update_user(data: UpdateUserRequest, access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         try:
             user_id = get_user_id_from_token(access_token)
-            user = db.query(User).filter(User.id == user_id).first()
+            user = await db.get(User, user_id)
             if not user:
                 raise HTTPException(status_code=404, detail="Пользователь не найден")
 
@@ -254,38 +257,40 @@ async def update_user(data: UpdateUserRequest, access_token: str = Depends(get_t
                 user.gender = data.gender
 
             if data.city_name:
-                city = db.query(City).filter(City.city_name == data.city_name).first()
-                if city:
-                    user.city_id = city.id
+                city_id = await db.scalar(select(City.id).where(City.city_name == data.city_name).limit(1))
+                if city_id:
+                    user.city_id = city_id
 
             if data.about_me:
                 user.about_me = data.about_me
 
-            db.commit()
+            await db.commit()
 
             return Response(status_code=201)
 
         except Exception as e:
             print("Exception:", e)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.post("/set_avatar/{photo_id}")
 async def set_avatar(photo_id: int, access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         try:
             user_id = get_user_id_from_token(access_token)
-            photo = db.query(UserPhoto).filter(UserPhoto.id == photo_id, UserPhoto.user_id == user_id).first()
+            photo = await db.scalar(
+                select(UserPhoto).where(UserPhoto.id == photo_id, UserPhoto.user_id == user_id).limit(1)
+            )
 
             if not photo:
                 raise HTTPException(status_code=200, detail="Фотография не найдена")
 
-            photo.set_as_avatar(db)
+            await db.run_sync(photo.set_as_avatar)
 
         except Exception as e:
             print("Exception:", e)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail="Internal server error")
 
     return {"detail": "Аватар успешно установлен"}
@@ -293,82 +298,90 @@ async def set_avatar(photo_id: int, access_token: str = Depends(get_token)):
 
 @router.get("/user/photos", response_model=UserPhotosResponse)
 async def get_user_photos(access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         try:
             user_id = get_user_id_from_token(access_token)
 
-            photos = db.query(UserPhoto).filter(UserPhoto.user_id == user_id).all()
+            photos = (await db.scalars(select(UserPhoto).where(UserPhoto.user_id == user_id))).all()
 
             if not photos:
                 return {"photos": []}
 
         except Exception as e:
             print("Exception:", e)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail="Internal server error")
 
-    return {"photos": photos}
+    urls = public_media_urls(photo.photo_url for photo in photos)
+    return {"photos": [
+        {"id": photo.id, "photo_url": urls[photo.photo_url], "is_avatar": photo.is_avatar}
+        for photo in photos
+    ]}
 
 
 @router.delete("/photos/{photo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_photo(photo_id: int, access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         try:
             user_id = get_user_id_from_token(access_token)
-            photo = db.query(UserPhoto).filter(UserPhoto.id == photo_id, UserPhoto.user_id == user_id).first()
+            photo = await db.scalar(
+                select(UserPhoto).where(UserPhoto.id == photo_id, UserPhoto.user_id == user_id).limit(1)
+            )
 
             if not photo:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Фото не найдено")
 
-            db.delete(photo)
-            db.commit()
+            await db.delete(photo)
+            await db.commit()
 
         except Exception as e:
             print("Exception:", e)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
 
 @router.post("/add_geolocation", summary="Добавление или обновление геопозиции пользователя")
-def add_geolocation(request: AddGeolocationRequest, access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+async def add_geolocation(request: AddGeolocationRequest, access_token: str = Depends(get_token)):
+    async with AsyncSessionLocal() as db:
         try:
             user_id = get_user_id_from_token(access_token)
-            user = db.query(User).filter(User.id == user_id).first()
+            user = await db.get(User, user_id)
 
             if not user:
                 raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-            existing_geolocation = db.query(UserGeolocation).filter(UserGeolocation.user_id == user_id).first()
+            existing_geolocation = await db.get(UserGeolocation, user_id)
 
             if existing_geolocation:
                 existing_geolocation.latitude = request.latitude
                 existing_geolocation.longitude = request.longitude
+                existing_geolocation.geo_cell = geo_cell(request.latitude, request.longitude)
                 existing_geolocation.updated_at = datetime.now()
                 message = "Геопозиция обновлена"
             else:
                 new_geolocation = UserGeolocation(
                     user_id=user_id,
                     latitude=request.latitude,
-                    longitude=request.longitude
+                    longitude=request.longitude,
+                    geo_cell=geo_cell(request.latitude, request.longitude)
                 )
                 db.add(new_geolocation)
                 message = "Геопозиция добавлена"
 
-            db.commit()
+            await db.commit()
             return {"message": message}
 
         except Exception as e:
             print("Exception:", e)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.get("/verify/check_verify", summary="Получение информации о верификации")
 async def get_current_user(access_token: str = Depends(get_token)):
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         user_id = get_user_id_from_token(access_token)
-        user = db.query(User).filter(User.id == user_id).one_or_none()
+        user = await db.get(User, user_id)
 
         if user is None:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
@@ -1,38 +1,57 @@
 from fastapi import FastAPI, HTTPException, status
-import firebase_admin
+from fastapi.concurrency import run_in_threadpool
 import os
-from firebase_admin import messaging, credentials
-from common.schemas import PushMessage
-from config import FIREBASE_CREDENTIALS_PATH
+from common.schemas import PushMessage, PushBatchRequest, PushBatchResponse
+from config import FIREBASE_CREDENTIALS_PATH, PUSH_MESSAGING_BACKEND
+from messaging_backend import create_messaging_backend, PushSendError
 
 
 
 app = FastAPI()
 
-cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-firebase_admin.initialize_app(cred)
+messaging_backend = create_messaging_backend(PUSH_MESSAGING_BACKEND, FIREBASE_CREDENTIALS_PATH)
 
 @app.post("/send_push")
 async def send_push(msg: PushMessage):
     try:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=msg.title,
-                body=msg.body),
-            data=msg.data,
-            token=msg.token)
-
-        response = messaging.send(message)
+        # Запрос к FCM блокирующий — выполняем в пуле потоков
+        response = await run_in_threadpool(messaging_backend.send, msg)
         return {"success": True, "response": response}
+    except PushSendError as e:
+        # Код ошибки и признак мёртвого токена нужны отправителю, чтобы отключить токен
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "success": False,
+                "error": str(e),
+                "error_code": e.error_code,
+                "token_invalid": e.token_invalid
+            })
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"success": False, "error": str(e)})
 
 
+@app.post("/send_push_batch", response_model=PushBatchResponse)
+async def send_push_batch(batch: PushBatchRequest):
+    try:
+        results = await run_in_threadpool(messaging_backend.send_batch, batch.messages)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "error": str(e)})
+
+    success_count = sum(1 for result in results if result.success)
+    return PushBatchResponse(
+        success_count=success_count,
+        failure_count=len(results) - success_count,
+        results=results
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
     app_host = os.getenv("MAIN_APP_HOST")
     uvicorn.run(app, host=app_host, port=1026)
-
@@ -0,0 +1,134 @@
+import itertools
+import threading
+from typing import List
+
+from common.schemas import PushMessage, PushResult
+
+# FCM принимает не больше 500 сообщений в одном send_each
+FCM_BATCH_LIMIT = 500
+
+# Коды ошибок, после которых токен больше не годится для отправки.
+# invalid_argument сюда не входит: FCM отвечает им и на некорректный payload при живом токене
+INVALID_TOKEN_ERRORS = {"unregistered", "sender_id_mismatch"}
+
+
+class PushSendError(Exception):
+    """
+    Ошибка отправки с классифицированным кодом (unregistered, invalid_argument, ...).
+    """
+
+    def __init__(self, message: str, error_code: str):
+        super().__init__(message)
+        self.error_code = error_code
+
+    @property
+    def token_invalid(self) -> bool:
+        return self.error_code in INVALID_TOKEN_ERRORS
+
+
+def chunked(messages: List[PushMessage], size: int = FCM_BATCH_LIMIT):
+    # Пачки не больше лимита FCM; общая для всех бэкендов, чтобы фейк резал так же, как FCM
+    for start in range(0, len(messages), size):
+        yield messages[start:start + size]
+
+
+def failed_result(token: str, error: PushSendError) -> PushResult:
+    return PushResult(
+        token=token,
+        success=False,
+        error=str(error),
+        error_code=error.error_code,
+        token_invalid=error.token_invalid
+    )
+
+
+class FirebaseMessagingBackend:
+    """
+    Отправка через firebase_admin. Методы блокирующие — вызывать вне цикла событий.
+    """
+
+    def __init__(self, credentials_path: str):
+        import firebase_admin
+        from firebase_admin import messaging, credentials, exceptions
+
+        self._messaging = messaging
+        self._exceptions = exceptions
+        firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+
+    def _build(self, msg: PushMessage):
+        return self._messaging.Message(
+            notification=self._messaging.Notification(
+                title=msg.title,
+                body=msg.body),
+            data=msg.data,
+            token=msg.token)
+
+    def _classify(self, exception: Exception) -> PushSendError:
+        if isinstance(exception, self._messaging.UnregisteredError):
+            error_code = "unregistered"
+        elif isinstance(exception, self._messaging.SenderIdMismatchError):
+            error_code = "sender_id_mismatch"
+        elif isinstance(exception, self._exceptions.FirebaseError):
+            # Код FCM вида INVALID_ARGUMENT, UNAVAILABLE, ...
+            error_code = str(exception.code).lower()
+        else:
+            error_code = "unknown"
+        return PushSendError(str(exception), error_code)
+
+    def send(self, msg: PushMessage) -> str:
+        try:
+            return self._messaging.send(self._build(msg))
+        except Exception as e:
+            raise self._classify(e) from e
+
+    def send_batch(self, messages: List[PushMessage]) -> List[PushResult]:
+        results = []
+        for chunk in chunked(messages):
+            batch = self._messaging.send_each([self._build(msg) for msg in chunk])
+            for msg, response in zip(chunk, batch.responses):
+                if response.success:
+                    results.append(PushResult(token=msg.token, success=True, message_id=response.message_id))
+                else:
+                    results.append(failed_result(msg.token, self._classify(response.exception)))
+        return results
+
+
+class FakeMessagingBackend:
+    """
+    Бэкенд без сети для локального запуска и тестов: запоминает отправленное и размеры пачек,
+    токены из failing_tokens считаются незарегистрированными.
+    """
+
+    def __init__(self, failing_tokens=()):
+        self.failing_tokens = set(failing_tokens)
+        self.sent = []
+        self.batch_sizes = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def send(self, msg: PushMessage) -> str:
+        if msg.token in self.failing_tokens:
+            raise PushSendError(f"Requested entity was not found: {msg.token}", "unregistered")
+        with self._lock:
+            self.sent.append(msg)
+            return f"fake-{next(self._ids)}"
+
+    def send_batch(self, messages: List[PushMessage]) -> List[PushResult]:
+        results = []
+        for chunk in chunked(messages):
+            with self._lock:
+                self.batch_sizes.append(len(chunk))
+            for msg in chunk:
+                try:
+                    results.append(PushResult(token=msg.token, success=True, message_id=self.send(msg)))
+                except PushSendError as e:
+                    results.append(failed_result(msg.token, e))
+        return results
+
+
+def create_messaging_backend(name: str, credentials_path: str = None):
+    if name == 'firebase':
+        return FirebaseMessagingBackend(credentials_path)
+    if name == 'fake':
+        return FakeMessagingBackend()
+    raise ValueError(f"Unsupported push messaging backend: {name}")
@@ -1,13 +1,52 @@
 import json
 import os
+from collections import Counter, defaultdict
 from datetime import datetime
 from urllib.parse import parse_qs
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import selectinload
 from common.models import User, Chat, Message, Media, DateInvitations, MessageTypeEnum, VoiceMessage
-from common.utils import get_user_id_from_token, send_push_notification, get_user_push_token, get_user_name
-from config import SessionLocal, logger, engine, socketio_logger, sio, socket_app, Base
-
-
-connected_users = {}
+from common.utils import (
+    get_user_id_from_token,
+    get_user_name,
+    push_dispatcher,
+    notify_user,
+    public_media_urls,
+    start_push_http_client,
+    close_push_http_client,
+    refresh_chat_summaries,
+    record_new_message,
+    record_messages_status,
+    record_messages_read
+)
+from common.migrations import run_migrations
+from config import AsyncSessionLocal, logger, engine, socketio_logger, sio, socket_app, Base, SOCKETIO_NODE_ID
+from presence import (
+    ConnectionRegistry,
+    user_room,
+    sync_node_presence,
+    reset_node_connections
+)
+
+
+connected_users = ConnectionRegistry()
+
+
+async def send_message_push(sender_id: int, recipient_id: int, message_content: str):
+    # Выполняется воркером очереди пушей, вне обработчика send_message
+    sender_name = await get_user_name(sender_id)
+    title = sender_name if sender_name else "Новое сообщение"
+    await notify_user(
+        recipient_id,
+        title,
+        message_content,
+        data={
+            'type': 'message'
+        },
+        aps={
+            "content-available": 1
+        }
+    )
 
 
 async def startup_event():
@@ -15,6 +54,26 @@ async def startup_event():
     Base.metadata.create_all(bind=engine)
 
 
+async def node_startup_event():
+    # socket_app может стартовать раньше main_app: схема (в том числе socket_connections) — на нём тоже
+    run_migrations(engine)
+    # Подключения этого узла из прошлого запуска уже не живы
+    async with AsyncSessionLocal() as db:
+        await reset_node_connections(db, SOCKETIO_NODE_ID)
+        await db.commit()
+    await start_push_http_client()
+
+
+async def shutdown_event():
+    # Сначала досылаем пуши из очереди, затем закрываем пул соединений с push_app
+    await push_dispatcher.stop()
+    await close_push_http_client()
+
+
+socket_app.on_startup = node_startup_event
+socket_app.on_shutdown = shutdown_event
+
+
 @sio.event
 async def connect(sid, environ):
     query_string = environ.get('QUERY_STRING')
@@ -34,23 +93,34 @@ async def connect(sid, environ):
         socketio_logger.error(f"Failed to authenticate user. Exception: {type(e).__name__}, Message: {str(e)}")
         return False
 
-    connected_users[user_id] = {'sid': sid, 'user_id': user_id}
+    first_connection = connected_users.add(user_id, sid)
+    await sio.enter_room(sid, user_room(user_id))
 
     socketio_logger.info(f"User with ID {user_id} connected, SID: {sid}")
 
-    with SessionLocal() as db:
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            user.status = 'online'
-            db.commit()
+    # БД трогаем только при первом подключении пользователя к этому узлу;
+    # общий статус учитывает подключения пользователя к другим узлам
+    if not first_connection:
+        return
+
+    async with AsyncSessionLocal() as db:
+        await sync_node_presence(db, connected_users, user_id, SOCKETIO_NODE_ID)
+        await db.commit()
 
 status_mapping = {
     'delivered': 1,
     'read': 2,
 }
 
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_PAGE_MAX_SIZE = 200
+# Не больше стольких message_ids в одной пачке квитанций
+RECEIPTS_MAX_BATCH = 500
+# Не больше стольких id в одном событии messages_status: payload должен пролезать в NOTIFY шины
+RECEIPTS_EMIT_CHUNK = 200
+
 
-# В остальной части вашего кода необходимо определить или импортировать status_mapping и SessionLocal
+# В остальной части вашего кода необходимо определить или импортировать status_mapping и AsyncSessionLocal
 
 @sio.event
 async def get_messages(sid, data):
@@ -62,27 +132,55 @@ async def get_messages(sid, data):
             return
 
     chat_id = data.get('chat_id')
-    user_info = next((info for info in connected_users.values() if info['sid'] == sid), None)
+    user_id = connected_users.user_id(sid)
 
-    if not user_info:
+    if not user_id:
         await sio.emit('error', {'error': 'Authentication failed'}, room=sid)
         return
 
-    user_id = user_info.get('user_id')
+    try:
+        limit = max(1, min(int(data.get('limit') or MESSAGES_PAGE_SIZE), MESSAGES_PAGE_MAX_SIZE))
+    except (TypeError, ValueError):
+        await sio.emit('error', {'error': 'Invalid limit'}, room=sid)
+        return
 
-    if user_id in connected_users:
-        connected_users[user_id]['sid'] = sid
-    else:
-        connected_users[user_id] = {'sid': sid, 'user_id': user_id}
+    # Курсоры сравниваются с Message.id, поэтому приводятся к int так же, как limit
+    try:
+        before_id = int(data['before_id']) if data.get('before_id') is not None else None
+        after_id = int(data['after_id']) if data.get('after_id') is not None else None
+    except (TypeError, ValueError):
+        await sio.emit('error', {'error': 'Invalid cursor'}, room=sid)
+        return
 
-    with SessionLocal() as db:
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    async with AsyncSessionLocal() as db:
+        chat = await db.get(Chat, chat_id)
 
         if not chat:
             await sio.emit('error', {'error': 'Chat not found'}, room=sid)
             return
 
-        messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.id.asc()).all()
+        # after_id — догрузка новых сообщений после переподключения (по возрастанию id),
+        # иначе — страница самых свежих сообщений до before_id (по убыванию, затем разворот)
+        query = select(Message).options(
+            selectinload(Message.media), selectinload(Message.voice_data)
+        ).where(Message.chat_id == chat_id)
+        if after_id is not None:
+            query = query.where(Message.id > after_id).order_by(Message.id.asc())
+        else:
+            if before_id is not None:
+                query = query.where(Message.id < before_id)
+            query = query.order_by(Message.id.desc())
+
+        # Лишнее сообщение показывает, есть ли ещё страница
+        messages = (await db.scalars(query.limit(limit + 1))).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if after_id is None:
+            messages.reverse()
+
+        # Ссылки на медиа всей страницы — одной пачкой
+        media_urls = public_media_urls(media.media_url for message in messages for media in message.media)
+
         filtered_messages = []
 
         for message in messages:
@@ -96,17 +194,17 @@ async def get_messages(sid, data):
             }
 
             if message.message_type in [MessageTypeEnum.image, MessageTypeEnum.voice]:
-                message_dict['media_urls'] = [media.media_url for media in message.media]
+                message_dict['media_urls'] = [media_urls[media.media_url] for media in message.media]
 
-                # Добавление voice_data если тип сообщения voice
-            if message.message_type == MessageTypeEnum.voice:
-                voice_message = db.query(VoiceMessage).filter(VoiceMessage.message_id == message.id).first()
-                if voice_message:
-                    message_dict['voice_data'] = voice_message.voice_data
+            # Добавление voice_data если тип сообщения voice
+            if message.message_type == MessageTypeEnum.voice and message.voice_data:
+                message_dict['voice_data'] = message.voice_data.voice_data
 
             filtered_messages.append(message_dict)
 
-        await sio.emit('get_messages', {'chatId': chat_id, 'messages': filtered_messages}, room=sid)
+        await sio.emit(
+            'get_messages', {'chatId': chat_id, 'messages': filtered_messages, 'has_more': has_more}, room=sid
+        )
 
 
 
@@ -123,19 +221,23 @@ async def send_message(sid, data):
     voice_data = data.get('voice_data')
 
     # Получаем sender_id из информации о подключении
-    sender_info = next((info for info in connected_users.values() if info['sid'] == sid), None)
+    sender_id = connected_users.user_id(sid)
 
-    if not sender_info:
+    if not sender_id:
         await sio.emit('error', {'error': 'Authentication failed'}, room=sid)
         return
 
-    sender_id = sender_info.get('user_id')
     socketio_logger.info(f"User with ID {sender_id} is sending a message to chat ID {chat_id}")
 
     message_type = data.get('message_type', 'text')
     media_urls = data.get('media_urls', [])
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
+        chat = await db.get(Chat, chat_id)
+        if chat is None:
+            await sio.emit('error', {'error': f'Chat with ID {chat_id} not found'}, room=sid)
+            return
+
         new_message = Message(
             chat_id=chat_id,
             sender_id=sender_id,
@@ -146,7 +248,7 @@ async def send_message(sid, data):
             message_type=message_type
         )
         db.add(new_message)
-        db.flush()
+        await db.flush()
 
         message_id = new_message.id
 
@@ -163,55 +265,34 @@ async def send_message(sid, data):
             )
             db.add(new_voice_message)
 
+        # Сводка чата обновляется в той же транзакции, что и сообщение
+        await db.run_sync(record_new_message, chat, new_message)
 
-        db.commit()
+        await db.commit()
         socketio_logger.info(f"Message ID {message_id} committed to database")
 
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
-        if chat is None:
-            await sio.emit('error', {'error': f'Chat with ID {chat_id} not found'}, room=sid)
-            return
-
         recipient_id = chat.user1_id if chat.user2_id == sender_id else chat.user2_id
-        recipient_info = connected_users.get(recipient_id)
+        public_urls = public_media_urls(media_urls)
 
-        sender_name = await get_user_name(sender_id)
-        title = sender_name if sender_name else "Новое сообщение"
+        await sio.emit(
+            'new_message', {
+                'message_id': message_id,
+                'message': message_content,
+                'chat_id': chat_id,
+                'sender_id': sender_id,
+                'reply_to_message_id': reply_to_message_id,
+                'message_type': message_type,
+                'media_urls': [public_urls.get(url, url) for url in media_urls],
+                'is_admin': is_admin
+            }, room=user_room(recipient_id)
+        )
+        socketio_logger.info(f"Message ID {message_id} sent to recipient ID {recipient_id} via socket")
 
-        if recipient_info:
-            recipient_sid = recipient_info.get('sid')
-            await sio.emit(
-                'new_message', {
-                    'message_id': message_id,
-                    'message': message_content,
-                    'chat_id': chat_id,
-                    'sender_id': sender_id,
-                    'reply_to_message_id': reply_to_message_id,
-                    'message_type': message_type,
-                    'media_urls': media_urls,
-                    'is_admin': is_admin
-                }, room=recipient_sid
-            )
-            socketio_logger.info(f"Message ID {message_id} sent to recipient ID {recipient_id} via socket")
-
-        push_token = await get_user_push_token(recipient_id)
-        if push_token:
-            if message_content is None:
-                logger.error("message_content is None, cannot send push notification.")
-            else:
-                notification_data = {
-                    'type': 'message'
-                }
-
-                await send_push_notification(
-                    push_token,
-                    title,
-                    message_content,
-                    data=notification_data,
-                    aps={
-                        "content-available": 1
-                    })
-                socketio_logger.info(f"Push notification sent to recipient ID {recipient_id} with token {push_token}")
+        # Пуш уходит в фоновую очередь: подтверждение отправителю не ждёт push_app
+        if message_content is None:
+            logger.error("message_content is None, cannot send push notification.")
+        else:
+            push_dispatcher.submit(send_message_push, sender_id, recipient_id, message_content)
 
     await sio.emit(
         'completer', {
@@ -230,27 +311,150 @@ async def send_message(sid, data):
 @sio.event
 async def message_delivered(sid, data):
     message_id = data.get('message_id')
-    with SessionLocal() as db:
-        message = db.query(Message).filter(Message.id == message_id).first()
-        if message:
-            message.status = 'delivered'
-            message.delivered_at = datetime.now()
-            db.commit()
+    async with AsyncSessionLocal() as db:
+        # Статус только растёт: прочитанное или уже доставленное сообщение не трогаем
+        delivered_ids = (await db.execute(
+            update(Message).where(
+                Message.id == message_id,
+                Message.status.is_distinct_from('delivered'),
+                Message.status.is_distinct_from('read')
+            ).values(status='delivered', delivered_at=datetime.now())
+            .returning(Message.id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+        if delivered_ids:
+            await db.run_sync(record_messages_status, delivered_ids, 'delivered')
+            await db.commit()
     await sio.emit('message_status', {'message_id': message_id, 'status': 'delivered'}, room=sid)
 
 
 @sio.event
 async def message_read(sid, data):
     message_id = data.get('message_id')
-    with SessionLocal() as db:
-        message = db.query(Message).filter(Message.id == message_id).first()
+    reader_id = connected_users.user_id(sid)
+    async with AsyncSessionLocal() as db:
+        message = await db.get(Message, message_id)
         if message:
+            if message.status != 'read' and reader_id and message.sender_id != reader_id:
+                await db.run_sync(record_messages_read, message.chat_id, reader_id, 1)
             message.status = 'read'
             message.read_at = datetime.now()
-            db.commit()
+            await db.run_sync(record_messages_status, [message.id], 'read')
+            await db.commit()
     await sio.emit('message_status', {'message_id': message_id, 'status': 'read'}, room=sid)
 
 
+async def apply_message_receipts(user_id, status, message_ids=None, chat_id=None, up_to_id=None) -> dict:
+    """
+    Применяет квитанции одним UPDATE к сообщениям собеседников из чатов пользователя.
+    Статус только растёт: delivered ставится сообщениям, которые ещё не доставлены и не прочитаны,
+    read — всем непрочитанным. Повторная квитанция ничего не меняет и никому не рассылается.
+    Возвращает {sender_id: [message_id, ...]} для реально изменённых сообщений.
+    """
+    conditions = [
+        Message.sender_id != user_id,
+        Message.chat_id.in_(select(Chat.id).where(or_(Chat.user1_id == user_id, Chat.user2_id == user_id))),
+        Message.status.is_distinct_from('read')
+    ]
+    if status == 'delivered':
+        # Статуса 'sent' в базе нет: новое сообщение сразу пишется как delivered
+        conditions.append(Message.status.is_distinct_from('delivered'))
+    if message_ids is not None:
+        conditions.append(Message.id.in_(message_ids))
+    if chat_id is not None:
+        conditions.append(Message.chat_id == chat_id)
+    if up_to_id is not None:
+        conditions.append(Message.id <= up_to_id)
+
+    if status == 'read':
+        values = {'status': 'read', 'read_at': datetime.now()}
+    else:
+        values = {'status': 'delivered', 'delivered_at': datetime.now()}
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            update(Message).where(*conditions).values(**values)
+            .returning(Message.id, Message.chat_id, Message.sender_id)
+            .execution_options(synchronize_session=False)
+        )).all()
+        if not rows:
+            return {}
+
+        await db.run_sync(record_messages_status, [row.id for row in rows], status)
+        if status == 'read':
+            read_counts = Counter(row.chat_id for row in rows)
+            for read_chat_id, read_count in read_counts.items():
+                await db.run_sync(record_messages_read, read_chat_id, user_id, read_count)
+        await db.commit()
+
+    ids_by_sender = defaultdict(list)
+    for row in rows:
+        ids_by_sender[row.sender_id].append(row.id)
+    return ids_by_sender
+
+
+@sio.event
+async def message_receipts(sid, data):
+    # Пачка квитанций: {'status': 'delivered'|'read', 'message_ids': [...]}
+    # или верхняя граница {'status': ..., 'chat_id': ..., 'up_to_id': ...}
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except json.JSONDecodeError:
+            await sio.emit('error', {'error': 'Invalid data format'}, room=sid)
+            return
+
+    user_id = connected_users.user_id(sid)
+    if not user_id:
+        await sio.emit('error', {'error': 'Authentication failed'}, room=sid)
+        return
+
+    status = data.get('status')
+    message_ids = data.get('message_ids')
+    chat_id = data.get('chat_id')
+    up_to_id = data.get('up_to_id')
+
+    if status not in ('delivered', 'read'):
+        await sio.emit('error', {'error': 'Invalid status'}, room=sid)
+        return
+    if message_ids is None and (chat_id is None or up_to_id is None):
+        await sio.emit('error', {'error': 'Either message_ids or chat_id with up_to_id is required'}, room=sid)
+        return
+    if message_ids is not None and not isinstance(message_ids, list):
+        await sio.emit('error', {'error': 'message_ids must be a list'}, room=sid)
+        return
+    if message_ids is not None and len(message_ids) > RECEIPTS_MAX_BATCH:
+        await sio.emit('error', {'error': f'At most {RECEIPTS_MAX_BATCH} message_ids per batch'}, room=sid)
+        return
+
+    # id сравниваются с Message.id, поэтому приводятся к int, как курсоры get_messages
+    try:
+        message_ids = [int(message_id) for message_id in message_ids] if message_ids is not None else None
+        chat_id = int(chat_id) if chat_id is not None else None
+        up_to_id = int(up_to_id) if up_to_id is not None else None
+    except (TypeError, ValueError):
+        await sio.emit('error', {'error': 'Invalid message ids'}, room=sid)
+        return
+
+    ids_by_sender = await apply_message_receipts(user_id, status, message_ids, chat_id, up_to_id)
+
+    # Одно событие на собеседника (частями по RECEIPTS_EMIT_CHUNK) вместо message_status на каждое сообщение
+    for sender_id, sender_message_ids in ids_by_sender.items():
+        for start in range(0, len(sender_message_ids), RECEIPTS_EMIT_CHUNK):
+            await sio.emit(
+                'messages_status',
+                {'message_ids': sender_message_ids[start:start + RECEIPTS_EMIT_CHUNK], 'status': status},
+                room=user_room(sender_id)
+            )
+
+    applied_ids = [message_id for sender_message_ids in ids_by_sender.values() for message_id in sender_message_ids]
+    for start in range(0, max(len(applied_ids), 1), RECEIPTS_EMIT_CHUNK):
+        await sio.emit(
+            'messages_status', {'message_ids': applied_ids[start:start + RECEIPTS_EMIT_CHUNK], 'status': status},
+            room=sid
+        )
+
+
 @sio.event
 async def all_messages_read(sid, data):
     socketio_logger.debug(connected_users)
@@ -267,53 +471,42 @@ async def all_messages_read(sid, data):
         await sio.emit('error', {'error': 'Missing required fields'}, room=sid)
         return
 
-    sender_id = None
-    for user_info in connected_users.values():
-        if user_info['sid'] == sid:
-            sender_id = user_info['user_id']
-            break
+    sender_id = connected_users.user_id(sid)
 
     if sender_id is None:
         await sio.emit('error', {'error': 'Sender not found'}, room=sid)
         return
 
-    with SessionLocal() as db:
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    async with AsyncSessionLocal() as db:
+        chat = await db.get(Chat, chat_id)
         if not chat:
             await sio.emit('error', {'error': 'Chat not found'}, room=sid)
             return
 
         receiver_id = chat.user1_id if chat.user1_id != sender_id else chat.user2_id
 
-    if not chat_id:
-        await sio.emit('error', {'error': 'Missing required field: chat_id'}, room=sid)
-        return
-
-    with SessionLocal() as db:
-        messages = db.query(Message).filter(
-            Message.chat_id == chat_id,
-            Message.sender_id != sender_id
-        ).all()
-
-        for message in messages:
-            message.status = 'read'
-            message.read_at = datetime.now()
-
-        db.commit()
-
-    receiver_info = connected_users.get(receiver_id)
-    if receiver_info:
-        receiver_sid = receiver_info.get('sid')
-        if receiver_sid:
-            await sio.emit(
-                'all_messages_read', {
-                    'chat_id': chat_id
-                }, room=receiver_sid
-            )
-        else:
-            await sio.emit('error', {'error': 'Receiver SID not found'}, room=sid)
-    else:
-        await sio.emit('error', {'error': 'Receiver not connected'}, room=sid)
+        # Один UPDATE на все непрочитанные сообщения собеседника вместо загрузки каждого в ORM
+        read_message_ids = (await db.execute(
+            update(Message).where(
+                Message.chat_id == chat_id,
+                Message.sender_id != sender_id,
+                Message.status.is_distinct_from('read')
+            ).values(status='read', read_at=datetime.now())
+            .returning(Message.id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+
+        await db.run_sync(record_messages_read, chat_id, sender_id)
+        await db.commit()
+
+    # Компактная квитанция: все сообщения собеседнику до last_read_message_id включительно прочитаны
+    await sio.emit(
+        'all_messages_read', {
+            'chat_id': chat_id,
+            'read_count': len(read_message_ids),
+            'last_read_message_id': max(read_message_ids, default=None)
+        }, room=user_room(receiver_id)
+    )
 
 
 @sio.event
@@ -330,22 +523,21 @@ async def delete_message(sid, data):
     delete_for_both = data.get('delete_for_both', False)
 
     # Получаем user_id таким же образом, как и в get_messages
-    user_info = next((info for info in connected_users.values() if info['sid'] == sid), None)
+    user_id = connected_users.user_id(sid)
 
-    if not user_info:
+    if not user_id:
         await sio.emit('error', {'error': 'Authentication failed'}, room=sid)
         return
 
-    user_id = user_info.get('user_id')
     socketio_logger.info(f"User with ID {user_id} is deleting a message in chat ID {chat_id}")
 
     if not message_id or not chat_id:
         await sio.emit('error', {'error': 'Invalid data'}, room=sid)
         return
 
-    with SessionLocal() as db:
-        message = db.query(Message).filter(Message.id == message_id, Message.chat_id == chat_id).first()
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    async with AsyncSessionLocal() as db:
+        message = await db.scalar(select(Message).where(Message.id == message_id, Message.chat_id == chat_id))
+        chat = await db.get(Chat, chat_id)
 
         if not message or not chat:
             await sio.emit('error', {'error': 'Message or chat not found'}, room=sid)
@@ -367,20 +559,23 @@ async def delete_message(sid, data):
             message.deleted_for_user1 = True
             message.deleted_for_user2 = True
 
-        db.commit()
+        # Удалённое сообщение могло быть последним или непрочитанным — пересчитываем сводки
+        await db.flush()
+        affected_user_ids = [chat.user1_id, chat.user2_id] if delete_for_both else [user_id]
+        for affected_user_id in affected_user_ids:
+            if affected_user_id is not None:
+                await db.run_sync(refresh_chat_summaries, affected_user_id, [chat_id])
+
+        await db.commit()
 
         # Включаем chat_id в ответ
         await sio.emit('delete_message', {'message_id': message_id, 'chat_id': chat_id}, room=sid)
 
         if delete_for_both:
-            chat = db.query(Chat).filter(Chat.id == chat_id).first()
             recipient_id = chat.user1_id if chat.user2_id == user_id else chat.user2_id
-            recipient_info = connected_users.get(recipient_id)
-
-            if recipient_info:
-                await sio.emit(
-                    'delete_message', {'message_id': message_id, 'chat_id': chat_id},  # Включаем chat_id в ответ
-                    room=recipient_info['sid'])
+            await sio.emit(
+                'delete_message', {'message_id': message_id, 'chat_id': chat_id},  # Включаем chat_id в ответ
+                room=user_room(recipient_id))
 
 
 @sio.event
@@ -397,21 +592,20 @@ async def delete_chat(sid, data):
 
     # Получаем user_id таким же образом, как и в get_messages
     socketio_logger.info(f"Connected users: {connected_users}")  # Заменено на logger
-    user_info = next((info for info in connected_users.values() if info['sid'] == sid), None)
+    user_id = connected_users.user_id(sid)
 
-    if not user_info:
+    if not user_id:
         await sio.emit('error', {'error': 'Authentication failed'}, room=sid)
         return
 
-    socketio_logger.info(f"User info for sid {sid}: {user_info}")  # Заменено на logger
-    user_id = user_info.get('user_id')
+    socketio_logger.info(f"User ID for sid {sid}: {user_id}")  # Заменено на logger
 
     if not chat_id:
         await sio.emit('error', {'error': 'Invalid data'}, room=sid)
         return
 
-    with SessionLocal() as db:
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    async with AsyncSessionLocal() as db:
+        chat = await db.get(Chat, chat_id)
 
         if not chat:
             await sio.emit('error', {'error': 'Chat not found'}, room=sid)
@@ -429,7 +623,7 @@ async def delete_chat(sid, data):
             chat.deleted_for_user1 = True
             chat.deleted_for_user2 = True
 
-        db.commit()
+        await db.commit()
 
         socketio_logger.info(f"User with ID {user_id} deleted chat with ID {chat_id}")  # Добавлено логирование
 
@@ -437,11 +631,8 @@ async def delete_chat(sid, data):
 
         if delete_for_both or (chat.deleted_for_user1 and chat.deleted_for_user2):
             recipient_id = chat.user1_id if chat.user2_id == user_id else chat.user2_id
-            recipient_info = connected_users.get(recipient_id)
-
-            if recipient_info:
-                await sio.emit(
-                    'delete_chat', {'chat_id': chat_id}, room=recipient_info['sid'])
+            await sio.emit(
+                'delete_chat', {'chat_id': chat_id}, room=user_room(recipient_id))
 
 
 @sio.event
@@ -459,31 +650,18 @@ async def update_verification_status(sid, data):
         await sio.emit('error', {'error': 'Missing data'}, room=sid)
         return
 
-    user_sid = connected_users.get(user_id)
-
-    if not user_sid:
-        logger.error(f"User with ID {user_id} is not connected.")
-        return
-
-    user_info = next((info for info in connected_users.values() if info['user_id'] == user_id), None)
-
-    if not user_info:
-        logger.error("User not found in connected users list")
-        await sio.emit('error', {'error': 'User not found'}, room=sid)
-        return
-
-    with SessionLocal() as db:
-        user = db.query(User).filter(User.id == user_id).first()
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
         if not user:
             logger.error("User not found in DB")
             await sio.emit('error', {'error': 'User not found in DB'}, room=sid)
             return
 
         user.is_verified = status == 'approved'
-        db.commit()
+        await db.commit()
 
-        logger.info(f"Emitting verification_update with status: {status} to sid: {user_sid}")
-        await sio.emit('verification_update', {'status': status}, room=user_sid)
+        logger.info(f"Emitting verification_update with status: {status} to user: {user_id}")
+        await sio.emit('verification_update', {'status': status}, room=user_room(user_id))
 
 
 @sio.event
@@ -494,17 +672,16 @@ async def send_date_invitation(sid, data):
     chat_id = data.get('chat_id')
 
     # Получаем sender_id из информации о подключении
-    sender_info = next((info for info in connected_users.values() if info['sid'] == sid), None)
+    sender_id = connected_users.user_id(sid)
 
-    if not sender_info:
+    if not sender_id:
         await sio.emit('error', {'error': 'Authentication failed'}, room=sid)
         return
 
-    sender_id = sender_info.get('user_id')
     socketio_logger.info(f"User with ID {sender_id} is sending a date invitation to chat ID {chat_id}")
 
-    with SessionLocal() as db:
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    async with AsyncSessionLocal() as db:
+        chat = await db.get(Chat, chat_id)
         if chat is None:
             await sio.emit('error', {'error': f'Chat with ID {chat_id} not found'}, room=sid)
             return
@@ -519,42 +696,35 @@ async def send_date_invitation(sid, data):
             status='pending'
         )
         db.add(new_invitation)
-        db.commit()
+        await db.commit()
         socketio_logger.info(f"Date invitation from user ID {sender_id} to user ID {recipient_id} recorded in database")
 
-        sender = db.query(User).filter(User.id == sender_id).first()
+        sender = await db.get(User, sender_id)
         sender_name = sender.first_name if sender else "Неизвестный пользователь"
 
         # Отправляем уведомление адресату, если он онлайн
-        recipient_info = connected_users.get(recipient_id)
-        if recipient_info:
-            recipient_sid = recipient_info.get('sid')
-            await sio.emit(
-                'date_invitation', {
-                    'chat_id': chat_id,
-                    'sender_id': sender_id,
-                    'action': 'invitation_sent',
-                    'status': 'pending'
-                }, room=recipient_sid
-            )
+        await sio.emit(
+            'date_invitation', {
+                'chat_id': chat_id,
+                'sender_id': sender_id,
+                'action': 'invitation_sent',
+                'status': 'pending'
+            }, room=user_room(recipient_id)
+        )
 
         # Отправляем пуш-уведомление
-        push_token = await get_user_push_token(recipient_id)
-        if push_token:
-            title = "Новое приглашение на свидание"
-            message_content = f"{sender_name} приглашает вас на свидание"
-            await send_push_notification(
-                push_token,
-                title,
-                message_content,
-                data={
-                    'invitation_type': 'date'
-                },
-                aps={
-                    "content-available": 1
-                }
-            )
-            socketio_logger.info(f"Push notification sent to recipient ID {recipient_id} with token {push_token}")
+        push_dispatcher.submit(
+            notify_user,
+            recipient_id,
+            "Новое приглашение на свидание",
+            f"{sender_name} приглашает вас на свидание",
+            data={
+                'invitation_type': 'date'
+            },
+            aps={
+                "content-available": 1
+            }
+        )
 
         # Отправляем подтверждение отправителю
         await sio.emit(
@@ -576,84 +746,77 @@ async def respond_date_invitation(sid, data):
     response = data.get('response')  # принять или отклонить
 
     # Получаем sender_id из информации о подключении
-    sender_info = next((info for info in connected_users.values() if info['sid'] == sid), None)
-    if not sender_info:
+    sender_id = connected_users.user_id(sid)
+    if not sender_id:
         await sio.emit('error', {'error': 'Authentication failed'}, room=sid)
         return
 
-    sender_id = sender_info.get('user_id')
     socketio_logger.info(f"User with ID {sender_id} responded to date invitation in chat ID {chat_id} with response: {response}")
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         # Получаем имя отправителя из базы данных
-        sender = db.query(User).filter(User.id == sender_id).first()
+        sender = await db.get(User, sender_id)
         sender_name = sender.name if sender else "Неизвестный пользователь"
 
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+        chat = await db.get(Chat, chat_id)
         if chat is None:
             await sio.emit('error', {'error': f'Chat with ID {chat_id} not found'}, room=sid)
             return
 
         # Обновляем статус приглашения в базе данных
-        invitation = db.query(DateInvitations).filter(
-            DateInvitations.chat_id == chat_id, DateInvitations.recipient_id == sender_id).first()
+        invitation = await db.scalar(select(DateInvitations).where(
+            DateInvitations.chat_id == chat_id, DateInvitations.recipient_id == sender_id).limit(1))
         if invitation:
             invitation.status = response
-            db.commit()
+            await db.commit()
             socketio_logger.info(f"Date invitation status updated to {response} in database")
 
         recipient_id = chat.user1_id if chat.user2_id == sender_id else chat.user2_id
-        recipient_info = connected_users.get(recipient_id)
 
         # Отправляем ответ инициатору приглашения
-        if recipient_info:
-            recipient_sid = recipient_info.get('sid')
-            await sio.emit(
-                'date_invitation', {
-                    'chat_id': chat_id,
-                    'sender_id': sender_id,
-                    'response': response
-                }, room=recipient_sid
-            )
+        await sio.emit(
+            'date_invitation', {
+                'chat_id': chat_id,
+                'sender_id': sender_id,
+                'response': response
+            }, room=user_room(recipient_id)
+        )
 
-            # Отправляем пуш-уведомление инициатору приглашения
-            push_token = await get_user_push_token(recipient_id)
-            if push_token:
-                title = "Ответ на ваше приглашение"
-                if response == "accepted":
-                    message_content = f"{sender_name} принял ваше приглашение на свидание"
-                elif response == "declined":
-                    message_content = f"Пользователь {sender_name} отклонил ваше приглашение на свидание"
-                else:
-                    message_content = "Неизвестный ответ на ваше приглашение"
-                await send_push_notification(
-                    push_token,
-                    title,
-                    message_content,
-                    data={
-                        'response_type': 'date'
-                    },
-                    aps={
-                        "content-available": 1
-                    }
-                )
-                socketio_logger.info(f"Push notification sent to initiator ID {recipient_id} with token {push_token}")
-            socketio_logger.info(f"Date response {response} sent to initiator ID {recipient_id} via socket")
+        # Отправляем пуш-уведомление инициатору приглашения
+        if response == "accepted":
+            message_content = f"{sender_name} принял ваше приглашение на свидание"
+        elif response == "declined":
+            message_content = f"Пользователь {sender_name} отклонил ваше приглашение на свидание"
+        else:
+            message_content = "Неизвестный ответ на ваше приглашение"
+        push_dispatcher.submit(
+            notify_user,
+            recipient_id,
+            "Ответ на ваше приглашение",
+            message_content,
+            data={
+                'response_type': 'date'
+            },
+            aps={
+                "content-available": 1
+            }
+        )
+        socketio_logger.info(f"Date response {response} sent to initiator ID {recipient_id} via socket")
 
 
 @sio.event
 async def disconnect(sid):
-    user_id = next((user_id for user_id, info in connected_users.items() if info['sid'] == sid), None)
+    user_id, was_last = connected_users.remove(sid)
 
     if user_id:
-        del connected_users[user_id]
         print(f"Removed user {user_id} with sid {sid} from connected_users")
 
-        with SessionLocal() as db:
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.status = 'offline'
-                db.commit()
+    # Закрылось последнее подключение пользователя на этом узле; офлайн он станет,
+    # только если не подключён к другим узлам
+    if was_last:
+        async with AsyncSessionLocal() as db:
+            await sync_node_presence(db, connected_users, user_id, SOCKETIO_NODE_ID)
+            await db.commit()
 
 
 if __name__ == "__main__":
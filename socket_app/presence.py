@@ -0,0 +1,131 @@
+from sqlalchemy import delete, exists, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+
+from common.models import SocketConnection, User
+
+# Первый ключ pg_advisory_xact_lock(key, user_id): переходы присутствия одного пользователя
+# на разных узлах (и в разных обработчиках одного узла) выполняются по очереди
+PRESENCE_LOCK_KEY = 7310002
+
+
+def user_room(user_id: int) -> str:
+    """
+    Комната Socket.IO, в которой состоят все подключения пользователя.
+    """
+    return f"user_{user_id}"
+
+
+class ConnectionRegistry:
+    """
+    Реестр подключений сокет-сервера: sid -> user_id и user_id -> {sid}.
+    Оба словаря меняются только вместе, поэтому поиск в любую сторону — O(1).
+    У пользователя может быть несколько одновременных подключений (устройств);
+    он считается онлайн, пока жив хотя бы один sid.
+    """
+
+    def __init__(self):
+        self._user_by_sid = {}  # sid -> user_id
+        self._sids_by_user = {}  # user_id -> set(sid)
+
+    def add(self, user_id: int, sid: str) -> bool:
+        """
+        Регистрирует подключение. Возвращает True, если это первое подключение пользователя.
+        """
+        self.remove(sid)
+        self._user_by_sid[sid] = user_id
+        sids = self._sids_by_user.setdefault(user_id, set())
+        sids.add(sid)
+        return len(sids) == 1
+
+    def remove(self, sid: str) -> tuple:
+        """
+        Удаляет подключение. Возвращает (user_id, было ли это последнее подключение пользователя);
+        для неизвестного sid — (None, False).
+        """
+        user_id = self._user_by_sid.pop(sid, None)
+        if user_id is None:
+            return None, False
+
+        sids = self._sids_by_user.get(user_id)
+        sids.discard(sid)
+        if sids:
+            return user_id, False
+        del self._sids_by_user[user_id]
+        return user_id, True
+
+    def user_id(self, sid: str):
+        return self._user_by_sid.get(sid)
+
+    def sids(self, user_id: int) -> set:
+        return set(self._sids_by_user.get(user_id, ()))
+
+    def is_connected(self, user_id: int) -> bool:
+        return user_id in self._sids_by_user
+
+    def __len__(self):
+        return len(self._user_by_sid)
+
+    def __repr__(self):
+        return f"ConnectionRegistry(users={len(self._sids_by_user)}, sids={len(self._user_by_sid)})"
+
+
+async def _mark_offline_if_disconnected(db, user_ids):
+    # Офлайн только тем, у кого не осталось подключений ни на одном узле
+    if not user_ids:
+        return
+    await db.execute(
+        update(User)
+        .where(
+            User.id.in_(user_ids),
+            ~exists().where(SocketConnection.user_id == User.id)
+        )
+        .values(status='offline')
+    )
+
+
+async def sync_node_presence(db, registry: ConnectionRegistry, user_id: int, node_id: str):
+    """
+    Приводит строку (user_id, node_id) в socket_connections к состоянию реестра узла.
+    Вызывается только на первом подключении и последнем отключении пользователя на узле.
+    Статус в users пишется, лишь когда строка узла первая (online) или последняя (offline)
+    во всём кластере. Реестр читается после блокировки: если за время ожидания пользователь
+    успел переподключиться или отключиться, записывается итоговое состояние.
+    """
+    await db.execute(
+        text("SELECT pg_advisory_xact_lock(:key, :user_id)"),
+        {"key": PRESENCE_LOCK_KEY, "user_id": user_id}
+    )
+    node_row = (SocketConnection.user_id == user_id) & (SocketConnection.node_id == node_id)
+    if registry.is_connected(user_id):
+        status = 'online'
+        changed = await db.execute(
+            insert(SocketConnection)
+            .values(user_id=user_id, node_id=node_id)
+            .on_conflict_do_nothing()
+            .returning(SocketConnection.user_id)
+        )
+    else:
+        status = 'offline'
+        changed = await db.execute(delete(SocketConnection).where(node_row).returning(SocketConnection.user_id))
+    if changed.first() is None:
+        # Узел уже в нужном состоянии — записал параллельный вызов
+        return
+
+    other_nodes = await db.scalar(select(exists().where(
+        SocketConnection.user_id == user_id, SocketConnection.node_id != node_id
+    )))
+    if not other_nodes:
+        await db.execute(update(User).where(User.id == user_id).values(status=status))
+
+
+async def reset_node_connections(db, node_id: str):
+    """
+    Удаляет подключения, оставшиеся от прошлого запуска узла (падение без disconnect),
+    и переводит в офлайн пользователей, у которых других подключений нет.
+    """
+    result = await db.execute(
+        delete(SocketConnection)
+        .where(SocketConnection.node_id == node_id)
+        .returning(SocketConnection.user_id)
+    )
+    await _mark_offline_if_disconnected(db, set(result.scalars()))
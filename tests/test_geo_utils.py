@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from common.utils.geo_utils import (
+    GEO_MAX_CELLS,
+    bounding_box,
+    cells_in_box,
+    geo_cell,
+    geo_filter_params,
+    longitude_ranges,
+)
+
+
+def _contains(params, latitude, longitude):
+    # То же, что geo_filter_sql, на Python
+    if params["use_geo_cells"] and geo_cell(latitude, longitude) not in params["geo_cells"]:
+        return False
+    if not params["min_lat"] <= latitude <= params["max_lat"]:
+        return False
+    return (params["min_lon"] <= longitude <= params["max_lon"]
+            or params["min_lon_2"] <= longitude <= params["max_lon_2"])
+
+
+def _params(latitude, longitude):
+    return geo_filter_params(SimpleNamespace(latitude=latitude, longitude=longitude))
+
+
+def test_bounding_box_contains_point():
+    min_lat, max_lat, min_lon, max_lon = bounding_box(55.75, 37.62)
+    assert min_lat < 55.75 < max_lat
+    assert min_lon < 37.62 < max_lon
+
+
+def test_bounding_box_at_pole_covers_all_longitudes():
+    min_lat, max_lat, min_lon, max_lon = bounding_box(89.9, 10)
+    assert max_lat == 90
+    assert (min_lon, max_lon) == (-180, 180)
+
+
+@pytest.mark.parametrize("min_lon, max_lon, expected", [
+    (10, 20, [(10, 20)]),
+    (179, 181, [(179, 180), (-180, -179)]),
+    (-181, -179, [(179, 180), (-180, -179)]),
+    (-180, 180, [(-180, 180)]),
+])
+def test_longitude_ranges(min_lon, max_lon, expected):
+    assert longitude_ranges(min_lon, max_lon) == expected
+
+
+def test_cells_in_box_include_own_cell():
+    cells = cells_in_box(bounding_box(55.75, 37.62))
+    assert geo_cell(55.75, 37.62) in cells
+    assert len(cells) == len(set(cells))
+
+
+def test_cells_in_box_capped_near_pole():
+    assert cells_in_box(bounding_box(89.9, 10)) is None
+    cells = cells_in_box(bounding_box(70, 10))
+    assert cells is not None and len(cells) <= GEO_MAX_CELLS
+
+
+@pytest.mark.parametrize("latitude, longitude, other_latitude, other_longitude", [
+    (65, 179.9, 65, -179.9),
+    (65, -179.9, 65, 179.9),
+    (0, 180, 0, -179.8),
+])
+def test_filter_crosses_antimeridian(latitude, longitude, other_latitude, other_longitude):
+    params = _params(latitude, longitude)
+    assert _contains(params, other_latitude, other_longitude)
+    assert _contains(params, latitude, longitude)
+    assert not _contains(params, latitude, 0)
+
+
+def test_filter_near_pole_uses_box_only():
+    params = _params(89.9, 10)
+    assert params["use_geo_cells"] is False
+    assert params["geo_cells"] == []
+    assert _contains(params, 89.95, -170)
+    assert not _contains(params, 80, 10)
+
+
+def test_filter_without_geolocation_passes_nothing():
+    params = geo_filter_params(None)
+    assert params["use_geo_cells"] is True
+    assert params["geo_cells"] == []
@@ -0,0 +1,168 @@
+import base64
+
+import pytest
+
+from common.utils import match_utils
+from common.utils.match_utils import (
+    CandidateIndex,
+    calculate_match_percentage,
+    decode_match_cursor,
+    encode_match_cursor,
+    match_cursor_params,
+)
+from config import MAX_DISTANCE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubIndex(CandidateIndex):
+    """
+    Индекс с корзинами из словарей вместо БД: city_id/ячейка -> {user_id: gender}.
+    """
+
+    def __init__(self, cities, cells, **kwargs):
+        super().__init__(**kwargs)
+        self.cities = cities
+        self.cells = cells
+        self.reads = []
+
+    def _read_city(self, db, city_id):
+        self._assert_unlocked()
+        self.reads.append(("city", city_id))
+        return {("city", city_id): self._group(self.cities.get(city_id, {}))}
+
+    def _read_cells(self, db, cells):
+        self._assert_unlocked()
+        self.reads.extend(("cell", cell) for cell in cells)
+        return {("cell", cell): self._group(self.cells.get(cell, {})) for cell in cells}
+
+    def _assert_unlocked(self):
+        # БД читается без блокировки индекса
+        assert self._lock.acquire(blocking=False)
+        self._lock.release()
+
+    @staticmethod
+    def _group(users):
+        members = {}
+        for user_id, gender in users.items():
+            members.setdefault(gender, set()).add(user_id)
+        return members
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(match_utils.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def index(clock):
+    return StubIndex(
+        cities={1: {10: "male", 11: "female", 12: "female"}, 2: {20: "female"}},
+        cells={"0:0": {11: "female", 30: "female"}, "0:1": {31: "female", 32: "male"}},
+        ttl=60,
+        max_buckets=10,
+    )
+
+
+def test_candidates_of_opposite_gender_from_city_and_cells(index):
+    assert index.get_candidates(None, 10, 1, "male", ["0:0", "0:1"]) == {11, 12, 30, 31}
+
+
+def test_buckets_are_cached_until_ttl(index, clock):
+    index.get_candidates(None, 10, 1, "male", ["0:0"])
+    index.get_candidates(None, 10, 1, "male", ["0:0"])
+    assert index.reads == [("city", 1), ("cell", "0:0")]
+
+    index.cities[1][13] = "female"
+    clock.now += 61
+    assert 13 in index.get_candidates(None, 10, 1, "male", ["0:0"])
+    assert index.reads == [("city", 1), ("cell", "0:0"), ("city", 1), ("cell", "0:0")]
+
+
+def test_apply_moves_user_between_cities(index):
+    index.get_candidates(None, 10, 1, "male")
+    index.get_candidates(None, 10, 2, "male")
+
+    index.apply([("user", 11, 2, "female", True)])
+
+    assert index.get_candidates(None, 10, 1, "male") == {12}
+    assert index.get_candidates(None, 10, 2, "male") == {11, 20}
+
+
+def test_apply_removes_deleted_user(index):
+    index.get_candidates(None, 10, 1, "male", ["0:0"])
+
+    index.apply([("user", 11, None, None, False)])
+
+    assert index.get_candidates(None, 10, 1, "male", ["0:0"]) == {12, 30}
+
+
+def test_apply_moves_user_between_cells(index):
+    index.get_candidates(None, 10, 1, "male", ["0:0", "0:1"])
+
+    index.apply([("geo", 30, "0:1")])
+
+    assert index.get_candidates(None, 10, 2, "male", ["0:0"]) == {11, 20}
+    assert index.get_candidates(None, 10, 2, "male", ["0:1"]) == {20, 30, 31}
+
+
+def test_apply_ignores_buckets_not_loaded(index):
+    index.apply([("user", 40, 1, "female", True), ("geo", 40, "0:0")])
+    assert index.reads == []
+    assert 40 not in index.get_candidates(None, 10, 1, "male", ["0:0"])
+
+
+def test_least_recently_used_buckets_are_evicted(clock):
+    index = StubIndex(cities={}, cells={}, ttl=60, max_buckets=2)
+    index.get_candidates(None, 10, 1, "male")
+    index.get_candidates(None, 10, 2, "male")
+    index.get_candidates(None, 10, 1, "male")
+    index.get_candidates(None, 10, 3, "male")
+
+    assert list(index._buckets) == [("city", 1), ("city", 3)]
+    index.get_candidates(None, 10, 2, "male")
+    assert index.reads[-1] == ("city", 2)
+
+
+@pytest.mark.parametrize("common, total, distance, expected", [
+    (2, 4, MAX_DISTANCE, 75.0),
+    (2, 4, MAX_DISTANCE + 1, 25.0),
+    (0, 0, 0, 50.0),
+    (3, 3, None, 50.0),
+])
+def test_calculate_match_percentage(common, total, distance, expected):
+    assert calculate_match_percentage(common, total, distance) == expected
+
+
+@pytest.mark.parametrize("match_percentage, user_id", [
+    (75.0, 12),
+    (0, 1),
+    (33.333333333333336, 987654),
+])
+def test_match_cursor_round_trip(match_percentage, user_id):
+    cursor = encode_match_cursor(match_percentage, user_id)
+    assert decode_match_cursor(cursor) == (match_percentage, user_id)
+
+
+@pytest.mark.parametrize("raw", [b"nan:1", b"inf:1", b"-inf:1", b"75.0", b"75.0:x", b"a:b:c"])
+def test_decode_match_cursor_rejects_malformed(raw):
+    with pytest.raises(ValueError):
+        decode_match_cursor(base64.urlsafe_b64encode(raw).decode())
+
+
+def test_decode_match_cursor_rejects_bad_base64():
+    with pytest.raises(ValueError):
+        decode_match_cursor("not base64!")
+
+
+def test_match_cursor_params():
+    assert match_cursor_params(None) == {"after_percentage": None, "after_id": None}
+    assert match_cursor_params((50.0, 7)) == {"after_percentage": 50.0, "after_id": 7}
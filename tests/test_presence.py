@@ -0,0 +1,51 @@
+from presence import ConnectionRegistry, user_room
+
+
+def test_user_room():
+    assert user_room(7) == "user_7"
+
+
+def test_first_and_last_connection_are_reported():
+    registry = ConnectionRegistry()
+
+    assert registry.add(1, "sid-a") is True
+    assert registry.add(1, "sid-b") is False
+    assert registry.sids(1) == {"sid-a", "sid-b"}
+    assert len(registry) == 2
+
+    assert registry.remove("sid-a") == (1, False)
+    assert registry.is_connected(1)
+    assert registry.remove("sid-b") == (1, True)
+    assert not registry.is_connected(1)
+    assert len(registry) == 0
+
+
+def test_lookup_by_sid():
+    registry = ConnectionRegistry()
+    registry.add(1, "sid-a")
+    registry.add(2, "sid-b")
+
+    assert registry.user_id("sid-a") == 1
+    assert registry.user_id("sid-b") == 2
+    assert registry.user_id("sid-unknown") is None
+
+
+def test_unknown_sid_is_ignored():
+    registry = ConnectionRegistry()
+    assert registry.remove("sid-unknown") == (None, False)
+
+
+def test_reused_sid_moves_to_new_user():
+    registry = ConnectionRegistry()
+    registry.add(1, "sid-a")
+
+    assert registry.add(2, "sid-a") is True
+    assert not registry.is_connected(1)
+    assert registry.user_id("sid-a") == 2
+
+
+def test_sids_returns_copy():
+    registry = ConnectionRegistry()
+    registry.add(1, "sid-a")
+    registry.sids(1).add("sid-x")
+    assert registry.sids(1) == {"sid-a"}
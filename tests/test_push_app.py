@@ -0,0 +1,78 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from push_app import app as push_app_module
+from messaging_backend import FCM_BATCH_LIMIT, FakeMessagingBackend, PushSendError
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = FakeMessagingBackend(failing_tokens={"dead-token"})
+    monkeypatch.setattr(push_app_module, "messaging_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def client():
+    return TestClient(push_app_module.app)
+
+
+def _message(token):
+    return {"token": token, "title": "Новое сообщение", "body": "Привет", "data": {"type": "message"}}
+
+
+def test_send_push(client, backend):
+    response = client.post("/send_push", json=_message("token-1"))
+
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "response": "fake-1"}
+    assert [msg.token for msg in backend.sent] == ["token-1"]
+
+
+def test_send_push_invalid_token(client, backend):
+    response = client.post("/send_push", json=_message("dead-token"))
+
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["error_code"] == "unregistered"
+    assert detail["token_invalid"] is True
+    assert backend.sent == []
+
+
+def test_send_push_batch_reports_each_token(client, backend):
+    tokens = ["token-1", "dead-token", "token-2"]
+    response = client.post("/send_push_batch", json={"messages": [_message(token) for token in tokens]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success_count"] == 2
+    assert body["failure_count"] == 1
+    assert [result["token"] for result in body["results"]] == tokens
+
+    ok, dead, _ = body["results"]
+    assert ok["success"] is True and ok["message_id"] == "fake-1"
+    assert dead["success"] is False
+    assert dead["error_code"] == "unregistered"
+    assert dead["token_invalid"] is True
+
+
+def test_send_push_batch_is_chunked(client, backend):
+    count = 2 * FCM_BATCH_LIMIT + 1
+    messages = [_message(f"token-{index}") for index in range(count)]
+    response = client.post("/send_push_batch", json={"messages": messages})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success_count"] == count
+    assert len(body["results"]) == count
+    assert backend.batch_sizes == [FCM_BATCH_LIMIT, FCM_BATCH_LIMIT, 1]
+
+
+@pytest.mark.parametrize("error_code, token_invalid", [
+    ("unregistered", True),
+    ("sender_id_mismatch", True),
+    ("invalid_argument", False),
+    ("unavailable", False),
+])
+def test_token_invalid_only_for_dead_tokens(error_code, token_invalid):
+    assert PushSendError("error", error_code).token_invalid is token_invalid
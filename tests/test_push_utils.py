@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from common.utils import service_utils
+from common.utils.push_utils import PushDispatcher
+from common.utils.service_utils import PushRetryableError, send_push_notification
+
+
+def test_stop_waits_for_retries():
+    attempts = []
+
+    async def flaky_job(name):
+        attempts.append(name)
+        if len(attempts) < 3:
+            raise ConnectionError("push_app is down")
+
+    async def scenario():
+        dispatcher = PushDispatcher(workers=2, queue_size=10, max_attempts=3, retry_delay=0.01)
+        assert dispatcher.submit(flaky_job, "push")
+        # Первая попытка падает, повтор ждёт паузу — stop должен его дождаться
+        await asyncio.sleep(0)
+        await dispatcher.stop()
+        assert not dispatcher._retries
+
+    asyncio.run(scenario())
+    assert attempts == ["push", "push", "push"]
+
+
+def test_gives_up_after_max_attempts():
+    attempts = []
+
+    async def failing_job():
+        attempts.append(1)
+        raise ConnectionError("push_app is down")
+
+    async def scenario():
+        dispatcher = PushDispatcher(workers=1, queue_size=10, max_attempts=2, retry_delay=0.01)
+        dispatcher.submit(failing_job)
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
+    assert len(attempts) == 2
+
+
+def _push_client(status_code, json):
+    transport = httpx.MockTransport(lambda request: httpx.Response(status_code, json=json))
+    return httpx.AsyncClient(base_url="http://push_app", transport=transport)
+
+
+@pytest.mark.parametrize("status_code, detail", [
+    (503, None),
+    (400, {"success": False, "error": "FCM unavailable", "error_code": "unavailable", "token_invalid": False}),
+])
+def test_send_push_notification_raises_on_retryable(monkeypatch, status_code, detail):
+    monkeypatch.setattr(service_utils, "push_http_client", _push_client(status_code, {"detail": detail}))
+
+    async def scenario():
+        with pytest.raises(PushRetryableError):
+            await send_push_notification("token", "title", "body", {}, {}, raise_on_retryable=True)
+        # Без флага поведение прежнее: ошибка логируется, возвращается None
+        assert await send_push_notification("token", "title", "body", {}, {}) is None
+
+    asyncio.run(scenario())
+
+
+def test_send_push_notification_does_not_retry_bad_request(monkeypatch):
+    detail = {"success": False, "error": "bad payload", "error_code": "invalid_argument", "token_invalid": False}
+    monkeypatch.setattr(service_utils, "push_http_client", _push_client(400, {"detail": detail}))
+
+    async def scenario():
+        return await send_push_notification("token", "title", "body", {}, {}, raise_on_retryable=True)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_notify_user_batches_pushes_and_deactivates_invalid_tokens(monkeypatch):
+    from common.utils import push_utils
+    from common.utils.push_utils import notify_user
+    from common.utils.service_utils import PushBatcher
+
+    requests = []
+    deactivated = []
+
+    def respond(request):
+        messages = json.loads(request.content)["messages"]
+        requests.append([message["token"] for message in messages])
+        results = [
+            {"token": message["token"], "success": message["token"] != "dead",
+             "error_code": None if message["token"] != "dead" else "unregistered",
+             "token_invalid": message["token"] == "dead"}
+            for message in messages
+        ]
+        return httpx.Response(200, json={"success_count": 2, "failure_count": 1, "results": results})
+
+    async def get_user_push_token(user_id):
+        return {1: "alive-1", 2: "dead", 3: "alive-3"}[user_id]
+
+    async def deactivate_push_tokens(tokens):
+        deactivated.extend(tokens)
+        return len(tokens)
+
+    monkeypatch.setattr(service_utils, "push_http_client", httpx.AsyncClient(
+        base_url="http://push_app", transport=httpx.MockTransport(respond)))
+    monkeypatch.setattr(service_utils, "deactivate_push_tokens", deactivate_push_tokens)
+    monkeypatch.setattr(push_utils, "get_user_push_token", get_user_push_token)
+    monkeypatch.setattr(push_utils, "push_batcher", PushBatcher(max_size=500, max_delay=0.01))
+
+    async def scenario():
+        await asyncio.gather(*(notify_user(user_id, "title", "body", {}, {}) for user_id in (1, 2, 3)))
+
+    asyncio.run(scenario())
+    assert requests == [["alive-1", "dead", "alive-3"]]
+    assert deactivated == ["dead"]
+
+
+def test_push_batcher_flushes_full_batch_and_raises_retryable(monkeypatch):
+    from common.utils.service_utils import PushBatcher
+
+    requests = []
+
+    def respond(request):
+        requests.append(len(json.loads(request.content)["messages"]))
+        return httpx.Response(503, json={"detail": None})
+
+    monkeypatch.setattr(service_utils, "push_http_client", httpx.AsyncClient(
+        base_url="http://push_app", transport=httpx.MockTransport(respond)))
+
+    async def scenario():
+        # Задержка больше таймаута теста: пачка уходит только потому, что набрала max_size
+        batcher = PushBatcher(max_size=2, max_delay=60)
+        sends = [batcher.send({"token": token, "title": "t", "body": "b", "data": {}}) for token in ("a", "b")]
+        return await asyncio.wait_for(asyncio.gather(*sends, return_exceptions=True), timeout=1)
+
+    results = asyncio.run(scenario())
+    assert requests == [2]
+    assert all(isinstance(result, PushRetryableError) for result in results)
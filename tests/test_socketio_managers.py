@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+import socketio
+
+from common.socketio_managers import create_client_manager
+from common.socketio_pubsub import LocalPubSubManager
+
+
+def _server(channel):
+    server = socketio.AsyncServer(async_mode='asgi', client_manager=create_client_manager('local://', channel=channel))
+    sent = []
+
+    async def send_eio_packet(eio_sid, eio_pkt):
+        sent.append((eio_sid, eio_pkt.data))
+
+    server._send_eio_packet = send_eio_packet
+    return server, sent
+
+
+def _events(sent):
+    # Пакет Socket.IO EVENT: "2" + JSON-массив [event, data]
+    return [(eio_sid, json.loads(data[1:])) for eio_sid, data in sent]
+
+
+async def _wait_for(sent, count):
+    for _ in range(100):
+        if len(sent) >= count:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_create_client_manager_local():
+    manager = create_client_manager('local://', channel='test-factory')
+    assert isinstance(manager, LocalPubSubManager)
+    assert manager.channel == 'test-factory'
+
+
+def test_emit_to_room_is_delivered_by_other_node():
+    async def scenario():
+        node_a, sent_a = _server('test-room')
+        node_b, sent_b = _server('test-room')
+        node_a.manager.initialize()
+        node_b.manager.initialize()
+        await asyncio.sleep(0)
+
+        # Подключение пользователя 7 живёт только на узле B
+        sid = await node_b.manager.connect('eio-b', '/')
+        await node_b.manager.enter_room(sid, '/', 'user_7')
+
+        await node_a.emit('new_message', {'text': 'hi'}, room='user_7')
+        await _wait_for(sent_b, 1)
+
+        assert _events(sent_b) == [('eio-b', ['new_message', {'text': 'hi'}])]
+        assert sent_a == []
+
+    asyncio.run(scenario())
+
+
+def test_emit_is_not_delivered_across_channels():
+    async def scenario():
+        node_a, _ = _server('test-channel-a')
+        node_b, sent_b = _server('test-channel-b')
+        node_a.manager.initialize()
+        node_b.manager.initialize()
+        await asyncio.sleep(0)
+
+        sid = await node_b.manager.connect('eio-b', '/')
+        await node_b.manager.enter_room(sid, '/', 'user_7')
+
+        await node_a.emit('new_message', {'text': 'hi'}, room='user_7')
+        await asyncio.sleep(0.05)
+
+        assert sent_b == []
+
+    asyncio.run(scenario())
+
+
+def test_emit_to_local_sid_skips_queue():
+    async def scenario():
+        node_a, sent_a = _server('test-direct')
+        node_b, sent_b = _server('test-direct')
+        node_a.manager.initialize()
+        node_b.manager.initialize()
+        await asyncio.sleep(0)
+
+        sid = await node_a.manager.connect('eio-a', '/')
+        await node_a.emit('error', {'error': 'Invalid data format'}, room=sid)
+
+        assert _events(sent_a) == [('eio-a', ['error', {'error': 'Invalid data format'}])]
+        assert sent_b == []
+
+    asyncio.run(scenario())
+
+
+class _FakeConnection:
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.listener = None
+        self.closed = False
+
+    async def execute(self, query, *args):
+        if query.startswith("SELECT pg_notify"):
+            self.listener(self, 0, args[0], args[1])
+
+    async def fetchval(self, query, *args):
+        if query.startswith("INSERT"):
+            self.payloads.append(args[0])
+            return len(self.payloads)
+        return self.payloads[args[0] - 1] if args[0] <= len(self.payloads) else None
+
+    def add_termination_listener(self, callback):
+        pass
+
+    async def add_listener(self, channel, callback):
+        self.listener = callback
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def execute(self, query, *args):
+        await self.connection.execute(query, *args)
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return pool.connection
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Acquire()
+
+
+def test_postgres_manager_spills_large_payloads(monkeypatch):
+    import asyncpg
+
+    from common.socketio_pubsub import NOTIFY_PAYLOAD_LIMIT, PAYLOAD_REF_PREFIX, PostgresNotifyManager
+
+    async def scenario():
+        connection = _FakeConnection([])
+        notified = []
+
+        async def connect(url):
+            return connection
+
+        monkeypatch.setattr(asyncpg, 'connect', connect)
+        manager = PostgresNotifyManager('postgresql+asyncpg://swipe@localhost/swipe', channel='test-spill')
+        manager._pool = _FakePool(connection)
+
+        listener = manager._listen()
+        next_message = asyncio.ensure_future(listener.__anext__())
+        await asyncio.sleep(0)
+        original_listener = connection.listener
+        connection.listener = lambda *args: (notified.append(args[3]), original_listener(*args))
+
+        small = {'method': 'emit', 'data': 'hi'}
+        large = {'method': 'emit', 'data': 'x' * (NOTIFY_PAYLOAD_LIMIT + 1)}
+        await manager._publish(small)
+        assert json.loads(await next_message) == small
+
+        await manager._publish(large)
+        assert json.loads(await listener.__anext__()) == large
+        assert notified[1] == f"{PAYLOAD_REF_PREFIX}1"
+        assert len(notified[1].encode()) < NOTIFY_PAYLOAD_LIMIT
+
+        await listener.aclose()
+        assert connection.closed
+
+    asyncio.run(scenario())
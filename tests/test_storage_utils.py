@@ -0,0 +1,201 @@
+import asyncio
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from common.utils.storage_utils import (
+    MediaUrlCache,
+    MemoryStorage,
+    StorageNotModified,
+    StorageObjectNotFound,
+    StorageRangeNotSatisfiable,
+    bucket_for_key,
+    etag_matches,
+    parse_byte_range,
+    resolve_byte_range,
+)
+from config import BUCKET_MESSAGE_IMAGES, BUCKET_MESSAGE_VOICES, BUCKET_PROFILE_IMAGES, BUCKET_VERIFY_IMAGES
+from main_app.controllers import service_controller
+
+DATA = bytes(range(256)) * 4  # 1024 байта
+
+
+async def _read(stored) -> bytes:
+    return b"".join([chunk async for chunk in stored.body])
+
+
+@pytest.fixture
+def storage():
+    storage = MemoryStorage(max_concurrency=2, chunk_size=100)
+    asyncio.run(storage.upload(io.BytesIO(DATA), BUCKET_MESSAGE_IMAGES, "image_1.png", content_type="image/png"))
+    yield storage
+    storage.close()
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, None)),
+    ("bytes=-50", (None, 50)),
+    ("bytes= 10 - 20", (10, 20)),
+    (None, None),
+    ("", None),
+    ("items=0-10", None),
+    ("bytes=0-10,20-30", None),
+    ("bytes=20-10", None),
+    ("bytes=-", None),
+    ("bytes=a-b", None),
+    ("bytes=10", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header) == expected
+
+
+@pytest.mark.parametrize("byte_range, expected", [
+    ((0, 99), (0, 99)),
+    ((1000, None), (1000, 1023)),
+    ((1000, 5000), (1000, 1023)),
+    ((None, 24), (1000, 1023)),
+    ((None, 5000), (0, 1023)),
+])
+def test_resolve_byte_range(byte_range, expected):
+    assert resolve_byte_range(byte_range, len(DATA)) == expected
+
+
+@pytest.mark.parametrize("byte_range, total_length", [
+    ((1024, None), 1024),
+    ((None, 0), 1024),
+    ((0, None), 0),
+])
+def test_resolve_byte_range_not_satisfiable(byte_range, total_length):
+    with pytest.raises(StorageRangeNotSatisfiable):
+        resolve_byte_range(byte_range, total_length)
+
+
+@pytest.mark.parametrize("if_none_match, etag, expected", [
+    ('"abc"', '"abc"', True),
+    ('W/"abc"', '"abc"', True),
+    ('"abc"', 'W/"abc"', True),
+    ('"x", "abc"', '"abc"', True),
+    ("*", '"abc"', True),
+    ('"x"', '"abc"', False),
+    ('"abc"', None, False),
+])
+def test_etag_matches(if_none_match, etag, expected):
+    assert etag_matches(if_none_match, etag) is expected
+
+
+def test_memory_storage_round_trip(storage):
+    stored = asyncio.run(storage.download(BUCKET_MESSAGE_IMAGES, "image_1.png"))
+
+    assert asyncio.run(_read(stored)) == DATA
+    assert stored.content_type == "image/png"
+    assert stored.content_length == len(DATA)
+    assert stored.content_range is None
+    assert stored.etag
+
+
+def test_memory_storage_missing_object(storage):
+    with pytest.raises(StorageObjectNotFound):
+        asyncio.run(storage.download(BUCKET_MESSAGE_IMAGES, "image_missing.png"))
+
+
+def test_memory_storage_range(storage):
+    stored = asyncio.run(storage.download(BUCKET_MESSAGE_IMAGES, "image_1.png", byte_range=(100, 349)))
+
+    assert asyncio.run(_read(stored)) == DATA[100:350]
+    assert stored.content_length == 250
+    assert stored.content_range == "bytes 100-349/1024"
+
+
+def test_memory_storage_not_modified(storage):
+    etag = asyncio.run(storage.download(BUCKET_MESSAGE_IMAGES, "image_1.png")).etag
+
+    with pytest.raises(StorageNotModified) as error:
+        asyncio.run(storage.download(BUCKET_MESSAGE_IMAGES, "image_1.png", if_none_match=etag))
+    assert error.value.stored.etag == etag
+
+
+def test_memory_storage_range_not_satisfiable(storage):
+    with pytest.raises(StorageRangeNotSatisfiable) as error:
+        asyncio.run(storage.download(BUCKET_MESSAGE_IMAGES, "image_1.png", byte_range=(2048, None)))
+    assert error.value.total_length == len(DATA)
+
+
+@pytest.fixture
+def client(storage, monkeypatch):
+    monkeypatch.setattr(service_controller, "storage", storage)
+    app = FastAPI()
+    app.include_router(service_controller.router)
+    return TestClient(app)
+
+
+def test_get_file(client):
+    response = client.get("/service/get_file/image_1.png")
+
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["content-length"] == str(len(DATA))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"]
+
+
+def test_get_file_range(client):
+    response = client.get("/service/get_file/image_1.png", headers={"Range": "bytes=-24"})
+
+    assert response.status_code == 206
+    assert response.content == DATA[-24:]
+    assert response.headers["content-range"] == "bytes 1000-1023/1024"
+
+
+def test_get_file_if_none_match(client):
+    etag = client.get("/service/get_file/image_1.png").headers["etag"]
+    response = client.get("/service/get_file/image_1.png", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_get_file_range_not_satisfiable(client):
+    response = client.get("/service/get_file/image_1.png", headers={"Range": "bytes=5000-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+def test_get_file_not_found(client):
+    assert client.get("/service/get_file/image_missing.png").status_code == 404
+
+
+@pytest.mark.parametrize("file_key, bucket", [
+    ("image_1.png", BUCKET_MESSAGE_IMAGES),
+    ("profile_1_20240101000000.jpg", BUCKET_PROFILE_IMAGES),
+    ("voice_1.m4a", BUCKET_MESSAGE_VOICES),
+    ("recording.m4a", BUCKET_MESSAGE_VOICES),
+    ("verification_1_20240101000000_1.jpg", None),
+])
+def test_bucket_for_key(file_key, bucket):
+    assert bucket_for_key(file_key) == bucket
+
+
+def test_get_file_hides_verification_photos(client, storage):
+    file_key = "verification_1_20240101000000_1.jpg"
+    asyncio.run(storage.upload(io.BytesIO(DATA), BUCKET_VERIFY_IMAGES, file_key, content_type="image/jpeg"))
+
+    assert client.get(f"/service/get_file/{file_key}").status_code == 404
+
+
+def test_verification_photos_are_not_presigned():
+    class PresigningStorage(MemoryStorage):
+        def presign(self, bucket, key, expires_in):
+            return f"https://storage/{bucket}/{key}"
+
+    cache = MediaUrlCache(PresigningStorage(), ttl=3600, refresh_margin=300, max_size=10)
+    private_url = "/service/get_file/verification_1_20240101000000_1.jpg"
+    resolved = cache.resolve([private_url, "/service/get_file/image_1.png"])
+
+    assert resolved[private_url] == private_url
+    assert resolved["/service/get_file/image_1.png"] == f"https://storage/{BUCKET_MESSAGE_IMAGES}/image_1.png"